@@ -1,139 +1,370 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from openai import OpenAI
-from config import BASE_URL, API_KEY, LLM_MODEL, PREDEFINED_ROLES
-from tree import DecisionTreeGenerator
+from config import (
+    LLM_MODEL, MAX_CONCURRENCY, EXPANSION_PRIORITY, EXPANSION_LEVELS, REUSE_SUBTREES, PROMPT_ENCODING, STREAM_PARTIAL, PERSISTENCE_MODE, PREDEFINED_ROLES, TREE_STORE_MAX_NODES,
+    SERVER_MAX_WORKERS, SERVER_MAX_QUEUE, WS_QUEUE_SIZE, WS_SLOW_CLIENT_POLICY, WS_REPLAY_EVENTS, WS_REPLAY_TREES,
+    SPECULATION_ENABLED, SPECULATION_FANOUT, SPECULATION_DEPTH, SPECULATION_TOKEN_BUDGET
+)
+from tree import AnswerNode, QuestionNode
+from async_tree import AsyncDecisionTreeGenerator
+from speculation import AsyncSpeculativeExpander
+from scheduler import GenerationBudget
+from cache import create_default_cache
+from catalog import create_default_catalog, is_complete
+from prompt_encoding import prompt_savings
+from compiled import CompiledTree, compile_tree, compiled_path
+from singleflight import AsyncSingleFlight
+from clients import create_async_openai_client
+from store import TreeStore
+from workers import BoundedTaskRunner, ExecutorBusyError
+from connections import ConnectionManager
+from metrics import registry as metrics_registry
 import asyncio
-import threading
-from typing import List
+import json
+import os
+import uuid
+from collections import OrderedDict
+from typing import Optional
 
 app = FastAPI()
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+# LLM response cache shared by all generations in this process
+response_cache = create_default_cache()
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Saved trees by normalized role/query, so repeated queries are served without LLM calls
+tree_catalog = create_default_catalog()
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+# Generated trees keyed by tree id; idle trees are evicted to logs/ when over the cap
+tree_store = TreeStore(max_nodes=TREE_STORE_MAX_NODES, catalog=tree_catalog)
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting: {e}")
+# Memory-mapped compiled forms of finished trees, for /navigate; the OS shares them between workers
+compiled_trees: "OrderedDict[str, CompiledTree]" = OrderedDict()
+COMPILED_TREES_OPEN = 256
+compile_flights = AsyncSingleFlight()
+
+def tree_snapshot(tree_id: str) -> Optional[dict]:
+    """
+    Current state of a tree for clients too far behind to replay its events.
+    Only trees in memory; the websocket handler loads evicted ones before subscribing.
+    """
+    entry = tree_store.get(tree_id)
+    if entry is None or entry.root is None:
+        return None
+    return entry.root.to_dict()
+
+# Events go only to the sockets subscribed to their tree, through per-client bounded queues,
+# and are numbered and buffered per tree so reconnecting clients can catch up
+manager = ConnectionManager(
+    max_queue=WS_QUEUE_SIZE, policy=WS_SLOW_CLIENT_POLICY, replay_events=WS_REPLAY_EVENTS,
+    replay_trees=WS_REPLAY_TREES, snapshot=tree_snapshot
+)
 
-manager = ConnectionManager()
+# One long-lived client (and connection pool) shared by every request, created on startup
+llm_client = None
+
+# Generation tasks run on the event loop; when the queue is full, requests get a 503
+runner = BoundedTaskRunner(max_concurrency=SERVER_MAX_WORKERS, max_queue=SERVER_MAX_QUEUE)
 
 class GenerateRequest(BaseModel):
     role: str
     query: str
     mode: str = "recursive"  # "recursive" or "interactive"
+    bypass_cache: bool = False
+    # Websocket to subscribe to the new tree's events (from the "hello" message)
+    connection_id: Optional[str] = None
 
 class ExpandRequest(BaseModel):
-    role: str
-    query: str
+    tree_id: str
     answer_id: str
-
-# Global reference to the main event loop
-main_loop = None
-# Store the root of the current tree
-current_tree_root = None
+    # Kept for older clients; the stored tree's role and query are used
+    role: str = ""
+    query: str = ""
+    bypass_cache: bool = False
+    connection_id: Optional[str] = None
 
 @app.on_event("startup")
 async def startup_event():
-    global main_loop
-    main_loop = asyncio.get_running_loop()
-
-def run_generation(role: str, query: str, mode: str):
-    global current_tree_root
-    client = OpenAI(base_url=BASE_URL, api_key=API_KEY)
-    
-    def callback(data):
-        if main_loop and main_loop.is_running():
-            asyncio.run_coroutine_threadsafe(manager.broadcast(data), main_loop)
-
-    generator = DecisionTreeGenerator(client, LLM_MODEL, callback=callback)
+    global llm_client
+    llm_client = create_async_openai_client()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    runner.shutdown()
+    if llm_client is not None:
+        await llm_client.close()
+
+async def run_generation(tree_id: str, role: str, query: str, mode: str, bypass_cache: bool = False):
+    # Events are broadcast directly from the loop, no thread hop needed
+    generator = AsyncDecisionTreeGenerator(
+        llm_client, LLM_MODEL, callback=manager.broadcast, max_workers=MAX_CONCURRENCY,
+        persistence=PERSISTENCE_MODE, cache=response_cache, bypass_cache=bypass_cache,
+        priority=EXPANSION_PRIORITY, expansion_levels=EXPANSION_LEVELS, reuse_subtrees=REUSE_SUBTREES,
+        catalog=tree_catalog, prompt_encoding=PROMPT_ENCODING, stream_partial=STREAM_PARTIAL
+    )
     try:
-        # Generate only root if interactive
+        # Register the root before building the rest, so reconnecting clients can get a snapshot
         recursive = (mode == "recursive")
-        root = generator.generate(role, query, recursive=recursive)
-        current_tree_root = root
-        
+        root = await generator.generate(role, query, recursive=False, tree_id=tree_id)
+        entry = await tree_store.add(root, role, query, LLM_MODEL)
+        if recursive:
+            async with tree_store.checkout(tree_id):
+                await generator.build(root, role, query, budget=GenerationBudget.from_config())
+
+        if not recursive and SPECULATION_ENABLED:
+            # Prefetch likely next questions; revealed instantly by /expand
+            entry.speculator = AsyncSpeculativeExpander(
+                # Misses expand through this generator, so it matches run_expansion's
+                AsyncDecisionTreeGenerator(
+                    llm_client, LLM_MODEL, callback=manager.broadcast, max_workers=MAX_CONCURRENCY,
+                    persistence=PERSISTENCE_MODE, cache=response_cache, expansion_levels=EXPANSION_LEVELS,
+                    reuse_subtrees=REUSE_SUBTREES, catalog=tree_catalog, prompt_encoding=PROMPT_ENCODING,
+                    stream_partial=STREAM_PARTIAL
+                ),
+                role, query, fan_out=SPECULATION_FANOUT, depth=SPECULATION_DEPTH,
+                token_budget=SPECULATION_TOKEN_BUDGET
+            )
+            entry.speculator.speculate(root)
+
         # Notify completion if recursive (interactive is never "complete" in the same way)
         if recursive:
-            if main_loop and main_loop.is_running():
-                asyncio.run_coroutine_threadsafe(manager.broadcast({"type": "complete"}), main_loop)
+            await manager.broadcast({
+                "type": "complete", "tree_id": tree_id, "run": generator.last_run, "prompts": prompt_savings(root)
+            })
     except Exception as e:
         print(f"Error in generation: {e}")
-        if main_loop and main_loop.is_running():
-            asyncio.run_coroutine_threadsafe(manager.broadcast({"type": "error", "message": str(e)}), main_loop)
-
-def run_expansion(role: str, query: str, answer_id: str):
-    global current_tree_root
-    if not current_tree_root:
-        return
-
-    client = OpenAI(base_url=BASE_URL, api_key=API_KEY)
-    
-    def callback(data):
-        if main_loop and main_loop.is_running():
-            asyncio.run_coroutine_threadsafe(manager.broadcast(data), main_loop)
-
-    generator = DecisionTreeGenerator(client, LLM_MODEL, callback=callback)
-    
+        await manager.broadcast({"type": "error", "tree_id": tree_id, "message": str(e)})
+
+async def load_stored_tree(match: dict) -> Optional[QuestionNode]:
+    """Root of a catalog match, from memory if registered, else from its file (None if unusable)."""
+    if match["tree_id"] in tree_store:
+        async with tree_store.checkout(match["tree_id"]) as entry:
+            return entry.root
+    return await asyncio.to_thread(tree_catalog.load, match)
+
+async def serve_stored_tree(match: dict, role: str, query: str, mode: str, tree_id: str, connection_id: Optional[str]):
+    """
+    Send a tree from the catalog to the requesting connection as one snapshot event;
+    generates it if the file is unusable. Finished trees are shared under their own id
+    (tree_id is the match's); interactive mode gets a copy under the new tree_id, since
+    expanding it must not change the stored tree or reach the clients of the original.
+    """
     try:
-        # Find the answer node
-        # Find the answer node
-        node = current_tree_root.find_node_by_id(answer_id)
-        if node and hasattr(node, 'potential_outcomes'): # Check if it's an AnswerNode
-             new_node = generator.expand_node(role, query, node)
-             if new_node is None:
-                 # It's a leaf node, send conclusion
-                 if main_loop and main_loop.is_running():
-                    asyncio.run_coroutine_threadsafe(
-                        manager.broadcast({
-                            "type": "leaf", 
-                            "parent_answer_id": answer_id,
-                            "outcome": node.potential_outcomes[0] if node.potential_outcomes else "No outcome specified"
-                        }), 
-                        main_loop
-                    )
+        root = await load_stored_tree(match)
+        if root is None:
+            await run_generation(tree_id, role, query, mode)
+            return
+        if mode == "recursive":
+            # Checked again: another request may have loaded it while this one read the file
+            if tree_id not in tree_store:
+                await tree_store.add(root, match["role"], match["query"], match["model"])
+        else:
+            root = root.copy(tree_id)
+            await tree_store.add(root, match["role"], match["query"], match["model"])
+        manager.send_snapshot(connection_id, tree_id, root.to_dict(), complete=(mode == "recursive"))
+    except Exception as e:
+        print(f"Error serving stored tree: {e}")
+        await manager.broadcast({"type": "error", "tree_id": tree_id, "message": str(e)})
+
+async def run_expansion(tree_id: str, answer_id: str, bypass_cache: bool = False):
+    generator = AsyncDecisionTreeGenerator(
+        llm_client, LLM_MODEL, callback=manager.broadcast, persistence=PERSISTENCE_MODE,
+        cache=response_cache, bypass_cache=bypass_cache, expansion_levels=EXPANSION_LEVELS,
+        reuse_subtrees=REUSE_SUBTREES, catalog=tree_catalog, prompt_encoding=PROMPT_ENCODING,
+        stream_partial=STREAM_PARTIAL
+    )
+
+    try:
+        # Reloads the tree from logs/ if it was evicted, and pins it while expanding
+        async with tree_store.checkout(tree_id) as entry:
+            # Find the answer node (O(1) lookup in the root's node index)
+            node = entry.root.find_node_by_id(answer_id)
+            if isinstance(node, AnswerNode) and node.child is not None:
+                # Already expanded (e.g. clicked in another window): resend it, no LLM call
+                await manager.broadcast({
+                    "type": "expand",
+                    "tree_id": tree_id,
+                    "parent_answer_id": answer_id,
+                    "node": generator._serialize_node(node.child)
+                })
+            elif isinstance(node, AnswerNode):
+                # Duplicate concurrent requests for this answer share one expansion
+                if entry.speculator is not None and not bypass_cache:
+                    new_node = await entry.speculator.expand(node)
+                else:
+                    new_node = await generator.expand_node(entry.role, entry.query, node)
+                if new_node is None:
+                    # It's a leaf node, send conclusion
+                    await manager.broadcast({
+                        "type": "leaf",
+                        "tree_id": tree_id,
+                        "parent_answer_id": answer_id,
+                        "outcome": node.potential_outcomes[0] if node.potential_outcomes else "No outcome specified"
+                    })
     except Exception as e:
         print(f"Error in expansion: {e}")
-        if main_loop and main_loop.is_running():
-            asyncio.run_coroutine_threadsafe(manager.broadcast({"type": "error", "message": str(e)}), main_loop)
+        await manager.broadcast({"type": "error", "tree_id": tree_id, "message": str(e)})
+
+async def open_compiled(tree_id: str) -> CompiledTree:
+    """The compiled form of a finished tree, compiling it on first use."""
+    compiled = compiled_trees.get(tree_id)
+    if compiled is None:
+        compiled = await compile_flights.do(tree_id, load_compiled, tree_id)
+        compiled_trees[tree_id] = compiled
+        while len(compiled_trees) > COMPILED_TREES_OPEN:
+            compiled_trees.popitem(last=False)[1].close()
+    compiled_trees.move_to_end(tree_id)
+    return compiled
+
+async def load_compiled(tree_id: str) -> CompiledTree:
+    entry = tree_store.get(tree_id)
+    stored = tree_catalog.get(tree_id) if entry is None and tree_catalog is not None else None
+    if entry is None and stored is None:
+        raise HTTPException(status_code=404, detail="Unknown tree id")
+    path = compiled_path(entry.path if entry is not None else stored["path"])
+    if not os.path.exists(path):
+        if entry is not None:
+            async with tree_store.checkout(tree_id) as entry:
+                if not is_complete(entry.root):
+                    raise HTTPException(status_code=409, detail="Tree is not finished")
+                # Finished trees are no longer modified, so compiling off the loop is safe
+                await asyncio.to_thread(compile_tree, entry.root, path, entry.role, entry.query, entry.model)
+        else:
+            if not stored["complete"]:
+                raise HTTPException(status_code=409, detail="Tree is not finished")
+            root = await asyncio.to_thread(tree_catalog.load, stored)
+            if root is None:
+                raise HTTPException(status_code=404, detail="Unknown tree id")
+            await asyncio.to_thread(compile_tree, root, path, stored["role"], stored["query"], stored["model"])
+    return CompiledTree(path)
+
+def submit(fn, *args):
+    """Start a generation task on the bounded runner, answering 503 if it is full."""
+    try:
+        runner.submit(fn, *args)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    connection = await manager.connect(websocket)
     try:
         while True:
-            # Keep connection alive
-            await websocket.receive_text()
+            # Clients send {"type": "subscribe" | "unsubscribe", "tree_id": ...}; a subscribe
+            # may carry "last_seq" to replay the events it missed
+            text = await websocket.receive_text()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                continue
+            if not isinstance(message, dict) or not message.get("tree_id"):
+                continue
+            if message.get("type") == "subscribe":
+                last_seq = message.get("last_seq")
+                if not isinstance(last_seq, int) or isinstance(last_seq, bool):
+                    last_seq = None
+                if last_seq is not None and message["tree_id"] in tree_store:
+                    # Pinned in memory (reloaded if evicted) in case the client needs a snapshot
+                    async with tree_store.checkout(message["tree_id"]):
+                        manager.subscribe(connection.id, message["tree_id"], last_seq)
+                else:
+                    manager.subscribe(connection.id, message["tree_id"], last_seq)
+            elif message.get("type") == "unsubscribe":
+                manager.unsubscribe(connection.id, message["tree_id"])
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
+    finally:
+        manager.disconnect(connection)
 
 @app.post("/generate")
 async def generate_tree(request: GenerateRequest):
-    thread = threading.Thread(target=run_generation, args=(request.role, request.query, request.mode))
-    thread.start()
-    return {"status": "started"}
+    match = None
+    if tree_catalog is not None and not request.bypass_cache:
+        # Recursive mode needs a finished tree; interactive mode can continue a partial one
+        match = tree_catalog.lookup(request.role, request.query, complete_only=(request.mode == "recursive"))
+    if match is not None:
+        tree_id = match["tree_id"] if request.mode == "recursive" else str(uuid.uuid4())
+        manager.subscribe(request.connection_id, tree_id)
+        submit(serve_stored_tree, match, request.role, request.query, request.mode, tree_id, request.connection_id)
+        return {
+            "status": "stored",
+            "tree_id": tree_id,
+            "match": {"role": match["role"], "query": match["query"], "score": match["score"]},
+        }
+
+    tree_id = str(uuid.uuid4())
+    # Subscribe before starting, so the root event cannot be missed
+    manager.subscribe(request.connection_id, tree_id)
+    submit(run_generation, tree_id, request.role, request.query, request.mode, request.bypass_cache)
+    return {"status": "started", "tree_id": tree_id}
 
 @app.post("/expand")
 async def expand_node(request: ExpandRequest):
-    thread = threading.Thread(target=run_expansion, args=(request.role, request.query, request.answer_id))
-    thread.start()
+    if request.tree_id not in tree_store:
+        raise HTTPException(status_code=404, detail="Unknown tree id")
+    manager.subscribe(request.connection_id, request.tree_id)
+    submit(run_expansion, request.tree_id, request.answer_id, request.bypass_cache)
     return {"status": "expanding"}
 
 @app.get("/roles")
 async def get_roles():
     return PREDEFINED_ROLES
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+@app.get("/queue/stats")
+async def get_queue_stats():
+    return runner.stats()
+
+@app.get("/connections/stats")
+async def get_connection_stats():
+    return manager.stats()
+
+@app.get("/trees/stats")
+async def get_tree_stats():
+    return tree_store.stats()
+
+@app.get("/catalog/stats")
+async def get_catalog_stats():
+    if tree_catalog is None:
+        return {"enabled": False}
+    return {"enabled": True, **tree_catalog.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/trees/{tree_id}/navigate")
+async def navigate_tree(tree_id: str, node: int = 0, answer: Optional[int] = None):
+    """
+    Walk a finished tree using its compiled form: returns question number node,
+    or, with answer, the question that follows that answer of it.
+    """
+    compiled = await open_compiled(tree_id)
+    try:
+        if answer is not None:
+            next_node = compiled.child(node, answer)
+            if next_node is None:
+                return {"tree_id": tree_id, "leaf": True, "answer": compiled.question(node)["answers"][answer]}
+            node = next_node
+        return {"tree_id": tree_id, "leaf": False, **compiled.question(node)}
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/trees/{tree_id}/speculation")
+async def get_speculation_stats(tree_id: str):
+    entry = tree_store.get(tree_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown tree id")
+    if entry.speculator is None:
+        return {"enabled": False}
+    return {"enabled": True, **entry.speculator.stats()}
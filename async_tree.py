@@ -0,0 +1,353 @@
+"""Asyncio variant of the decision tree generator, built on AsyncOpenAI."""
+
+import asyncio
+import inspect
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from openai import AsyncOpenAI
+
+from cache import ResponseCache
+from metrics import record_llm_call
+from persistence import TreeJournal, tree_writer
+from ratelimit import AdaptiveLimiter, RETRYABLE_ERRORS, call_with_retry_async
+from singleflight import AsyncSingleFlight
+from streaming import PartialQuestion
+from prompt_encoding import decode_outcome_list
+from scheduler import ExpansionScheduler, GenerationBudget
+from pydantic import BaseModel
+
+from config import MAX_DEPTH
+from tree import DecisionTreeGenerator, QuestionSchema, SubtreeQuestionSchema, QuestionNode, AnswerNode
+
+
+# In-flight expand_node() calls by answer id, shared by every generator on the loop
+expansion_flights = AsyncSingleFlight()
+
+
+class AsyncDecisionTreeGenerator(DecisionTreeGenerator):
+    """
+    Generates a decision tree using an async LLM client.
+
+    Expansions run as tasks on the event loop instead of OS threads, with at most
+    max_workers expansions in flight. The callback may be a plain function or a
+    coroutine function; coroutine callbacks are awaited in place. Tree mutation
+    happens between awaits, so no locking is needed on the loop.
+    """
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        llm_model: str,
+        callback: Optional[Callable[[dict], Union[None, Awaitable[None]]]] = None,
+        max_workers: int = 1,
+        persistence: str = "snapshot",
+        cache: Optional[ResponseCache] = None,
+        bypass_cache: bool = False,
+        priority: str = "outcomes",
+        expansion_levels: int = 1,
+        reuse_subtrees: bool = False,
+        limiter: Optional[AdaptiveLimiter] = None,
+        catalog: Optional[Any] = None,
+        prompt_encoding: str = "full",
+        stream_partial: bool = False,
+        on_expansion: Optional[Callable[[float], None]] = None,
+    ):
+        """
+        Takes the arguments of DecisionTreeGenerator, plus:
+            stream_partial: Stream single-level expansions and emit "partial_expand"
+                      events with the question and each finished answer as soon as
+                      they arrive, before the final "expand" event.
+        """
+        super().__init__(
+            client, llm_model, callback=callback, max_workers=max_workers,
+            persistence=persistence, cache=cache, bypass_cache=bypass_cache, priority=priority,
+            expansion_levels=expansion_levels, reuse_subtrees=reuse_subtrees, limiter=limiter,
+            catalog=catalog, prompt_encoding=prompt_encoding, on_expansion=on_expansion,
+        )
+        self.stream_partial = stream_partial
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def generate(
+        self,
+        role: str,
+        query: str,
+        recursive: bool = True,
+        tree_id: Optional[str] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> QuestionNode:
+        """Async counterpart of DecisionTreeGenerator.generate."""
+        print(f"Fetching initial question for: {query}")
+        initial_data, log_entry = await self._get_initial_question(role, query)
+
+        root, event = self._create_root(role, query, initial_data, log_entry, tree_id)
+        await self._emit(event)
+
+        if recursive:
+            print("Building decision tree recursively...")
+            await self._build(role, query, root, root.answers, budget)
+
+        return root
+
+    async def resume(
+        self, root: QuestionNode, role: str, query: str, budget: Optional[GenerationBudget] = None
+    ) -> QuestionNode:
+        """Async counterpart of DecisionTreeGenerator.resume."""
+        frontier = [node for node in root.iter_subtree() if isinstance(node, AnswerNode) and node.frontier]
+        for answer in frontier:
+            answer.frontier = False
+        print(f"Resuming generation from {len(frontier)} frontier answers...")
+        await self._build(role, query, root, frontier, budget)
+        return root
+
+    async def build(
+        self, root: QuestionNode, role: str, query: str, budget: Optional[GenerationBudget] = None
+    ) -> QuestionNode:
+        """Async counterpart of DecisionTreeGenerator.build."""
+        print("Building decision tree recursively...")
+        await self._build(role, query, root, root.answers, budget)
+        return root
+
+    async def _build(
+        self,
+        role: str,
+        query: str,
+        root: QuestionNode,
+        answers: List[AnswerNode],
+        budget: Optional[GenerationBudget],
+    ) -> None:
+        scheduler = ExpansionScheduler(budget, self.priority)
+        for answer in answers:
+            scheduler.push(answer)
+        await self._run_scheduler(role, query, scheduler)
+        self._finish_run(role, query, root, scheduler)
+        # Return once the final snapshot is on disk, without blocking the loop on it
+        await asyncio.wrap_future(tree_writer.flush())
+
+    def _append_journal(self, root: QuestionNode, role: str, query: str, record: Dict[str, Any]) -> None:
+        """Queue the append on the background writer; the record is captured now."""
+        path = self._tree_filename(root, role, query, ".journal.jsonl")
+        job = self._journal_job(root, role, query, record, tree_writer.journal_exists(path))
+        tree_writer.submit(job, journal=path)
+
+    def _save_snapshot(self, root: QuestionNode, role: str, query: str) -> None:
+        tree_writer.submit(self._snapshot_job(root, role, query))
+
+    def compact(self, root: QuestionNode, role: str, query: str) -> None:
+        """Queue the snapshot and the removal of the journal it supersedes on the background writer."""
+        path = self._tree_filename(root, role, query, ".journal.jsonl")
+        snapshot = self._snapshot_job(root, role, query)
+
+        def job() -> None:
+            if snapshot():
+                TreeJournal(path).remove()
+        tree_writer.submit(job, journal=path, journal_exists=False)
+
+    async def expand_node(self, role: str, query: str, answer_node: AnswerNode) -> Optional[QuestionNode]:
+        """Async counterpart of DecisionTreeGenerator.expand_node, with the same coalescing."""
+        if answer_node.child is not None:
+            return answer_node.child
+        return await expansion_flights.do(answer_node.id, self._expand_once, role, query, answer_node)
+
+    async def _expand_once(self, role: str, query: str, answer_node: AnswerNode) -> Optional[QuestionNode]:
+        if answer_node.child is not None:
+            return answer_node.child
+        return (await self._timed_expand(role, query, answer_node))[0]
+
+    async def _expand_scheduled(
+        self, role: str, query: str, answer_node: AnswerNode, max_depth: int
+    ) -> tuple[Optional[QuestionNode], Optional[Dict[str, Any]]]:
+        """Async counterpart of DecisionTreeGenerator._expand_scheduled."""
+        log_entries = []
+
+        async def expand() -> Optional[QuestionNode]:
+            if answer_node.child is not None:
+                return answer_node.child
+            question_node, log_entry = await self._timed_expand(role, query, answer_node, max_depth)
+            log_entries.append(log_entry)
+            return question_node
+
+        question_node = await expansion_flights.do(answer_node.id, expand)
+        return question_node, (log_entries[0] if log_entries else None)
+
+    async def _timed_expand(
+        self, role: str, query: str, answer_node: AnswerNode, max_depth: int = MAX_DEPTH
+    ) -> tuple[Optional[QuestionNode], Optional[Dict[str, Any]]]:
+        if self.on_expansion is None:
+            return await self._expand(role, query, answer_node, max_depth)
+        start = time.perf_counter()
+        result = await self._expand(role, query, answer_node, max_depth)
+        self.on_expansion(time.perf_counter() - start)
+        return result
+
+    async def _expand(
+        self, role: str, query: str, answer_node: AnswerNode, max_depth: int = MAX_DEPTH
+    ) -> tuple[Optional[QuestionNode], Optional[Dict[str, Any]]]:
+        if answer_node.is_leaf:
+            return None, None
+
+        if self.reuse_subtrees:
+            question_node, events = self._reuse_subtree(role, query, answer_node, max_depth)
+            for event in events:
+                await self._emit(event)
+            if question_node is not None:
+                return question_node, None
+
+        history = answer_node.get_history_str()
+        if self._multi_level(answer_node, max_depth):
+            subtree_data, log_entry = await self._get_subtree(role, query, history, answer_node.potential_outcomes)
+            question_node, events = self._graft_subtree(
+                role, query, answer_node, subtree_data, log_entry, max_depth
+            )
+            for event in events:
+                await self._emit(event)
+            return question_node, log_entry
+
+        question_data, log_entry = await self._get_discriminating_question(
+            role, query, history, answer_node.potential_outcomes,
+            stream_to=answer_node if self.stream_partial and self.callback else None
+        )
+
+        question_node, event = self._attach_question(role, query, answer_node, question_data, log_entry)
+        if event is not None:
+            await self._emit(event)
+        return question_node, log_entry
+
+    async def _run_scheduler(self, role: str, query: str, scheduler: ExpansionScheduler) -> None:
+        """Expand scheduled answers as tasks, keeping up to max_workers in flight."""
+        pending: Dict[asyncio.Task, AnswerNode] = {}
+        try:
+            while True:
+                while len(pending) < self.max_workers:
+                    answer = scheduler.next()
+                    if answer is None:
+                        break
+                    task = asyncio.create_task(
+                        self._expand_scheduled(role, query, answer, scheduler.budget.max_depth)
+                    )
+                    pending[task] = answer
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    answer = pending.pop(task)
+                    try:
+                        question_node, log_entry = task.result()
+                    except RETRYABLE_ERRORS as e:
+                        print(f"Expansion failed, leaving answer for resume: {e}")
+                        scheduler.defer(answer)
+                        continue
+                    if question_node:
+                        self._schedule_children(scheduler, question_node, log_entry)
+        finally:
+            # On error, drop expansions still in flight instead of finishing the whole tree
+            for task in pending:
+                task.cancel()
+
+    async def _get_initial_question(self, role: str, query: str) -> tuple[QuestionSchema, Dict[str, Any]]:
+        system_prompt, user_prompt = self._initial_prompts(role, query)
+
+        start_time = time.time()
+        response_json, cached, usage = await self._parse_question(system_prompt, user_prompt)
+        duration = time.time() - start_time
+        print(f"Root Question: {response_json.question}")
+
+        log_entry = self._log_entry(
+            "initial_question", duration, cached, system_prompt, user_prompt, response_json, usage
+        )
+        self._note_savings(log_entry, self._initial_prompts, role, query)
+        record_llm_call(self.llm_model, role, log_entry)
+        return response_json, log_entry
+
+    async def _get_discriminating_question(
+        self, role: str, query: str, history: str, outcomes: list[str], stream_to: Optional[AnswerNode] = None
+    ) -> tuple[QuestionSchema, Dict[str, Any]]:
+        system_prompt, user_prompt = self._discriminating_prompts(role, query, history, outcomes)
+
+        start_time = time.time()
+        response_json, cached, usage = await self._parse_question(system_prompt, user_prompt, stream_to=stream_to)
+        duration = time.time() - start_time
+        response_json = self._decode(response_json, outcomes)
+        log_entry = self._log_entry(
+            "discriminating_question", duration, cached, system_prompt, user_prompt, response_json, usage
+        )
+        self._note_savings(log_entry, self._discriminating_prompts, role, query, history, outcomes)
+        record_llm_call(self.llm_model, role, log_entry)
+        return response_json, log_entry
+
+    async def _get_subtree(
+        self, role: str, query: str, history: str, outcomes: list[str]
+    ) -> tuple[SubtreeQuestionSchema, Dict[str, Any]]:
+        system_prompt, user_prompt = self._subtree_prompts(role, query, history, outcomes)
+
+        start_time = time.time()
+        response_json, cached, usage = await self._parse_question(system_prompt, user_prompt, SubtreeQuestionSchema)
+        duration = time.time() - start_time
+        response_json = self._decode(response_json, outcomes)
+        log_entry = self._log_entry(
+            "subtree_question", duration, cached, system_prompt, user_prompt, response_json, usage
+        )
+        self._note_savings(log_entry, self._subtree_prompts, role, query, history, outcomes)
+        record_llm_call(self.llm_model, role, log_entry)
+        return response_json, log_entry
+
+    async def _parse_question(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        schema: type[BaseModel] = QuestionSchema,
+        stream_to: Optional[AnswerNode] = None,
+    ) -> tuple[BaseModel, bool, Optional[Dict[str, int]]]:
+        key, cached = self._cache_lookup(system_prompt, user_prompt, schema)
+        if cached is not None:
+            return cached, True, None
+
+        # Created lazily so the semaphore binds to the loop that runs the generator
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            if stream_to is not None:
+                request = lambda: self._stream_question(system_prompt, user_prompt, schema, stream_to)
+            else:
+                request = lambda: self.client.beta.chat.completions.parse(
+                    model=self.llm_model,
+                    messages=self._messages(system_prompt, user_prompt),
+                    response_format=schema,
+                )
+            response = await call_with_retry_async(request, self.llm_model, self.limiter)
+        parsed = response.choices[0].message.parsed
+        self._cache_store(key, parsed)
+        return parsed, False, self._usage(response)
+
+    async def _stream_question(
+        self, system_prompt: str, user_prompt: str, schema: type[BaseModel], answer_node: AnswerNode
+    ) -> Any:
+        """Stream a question, emitting "partial_expand" events as its parts complete. Returns the final completion."""
+        partial = PartialQuestion()
+        async with self.client.beta.chat.completions.stream(
+            model=self.llm_model,
+            messages=self._messages(system_prompt, user_prompt),
+            response_format=schema,
+            stream_options={"include_usage": True},
+        ) as stream:
+            async for event in stream:
+                if event.type != "content.delta":
+                    continue
+                ready = partial.update(event.snapshot)
+                if ready is not None:
+                    if self.prompt_encoding == "compact":
+                        for answer in ready["answers"]:
+                            answer["outcomes"] = decode_outcome_list(answer["outcomes"], answer_node.potential_outcomes)
+                    await self._emit({
+                        "type": "partial_expand",
+                        "tree_id": answer_node.root.id,
+                        "parent_answer_id": answer_node.id,
+                        **ready,
+                    })
+            return await stream.get_final_completion()
+
+    async def _emit(self, event: Dict[str, Any]) -> None:
+        if self.callback:
+            result = self.callback(event)
+            if inspect.isawaitable(result):
+                await result
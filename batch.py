@@ -0,0 +1,184 @@
+"""
+Batch generation of decision trees for many (role, query) pairs.
+
+Reads a JSONL file ({"role": ..., "query": ..., "id": optional}) or a CSV with
+role,query[,id] columns, generates full trees concurrently and streams each
+finished tree to an output directory (one <id>.json per tree) or to a single
+JSONL file. Items already present in the output are skipped, so an
+interrupted run continues where it stopped when started again.
+
+Usage:
+    python batch.py queries.jsonl --output trees/ [--workers 4] [--max-concurrency 16]
+    python batch.py queries.csv --output trees.jsonl
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from config import LLM_MODEL, MAX_CONCURRENCY, EXPANSION_PRIORITY, EXPANSION_LEVELS, REUSE_SUBTREES, PROMPT_ENCODING, PERSISTENCE_MODE
+from tree import DecisionTreeGenerator, QuestionNode, write_tree_snapshot
+from scheduler import GenerationBudget
+from ratelimit import AdaptiveLimiter
+from cache import create_default_cache
+from clients import create_openai_client
+from persistence import TreeJournal
+import metrics
+
+
+def item_id(role: str, query: str) -> str:
+    """Stable id for a pair, so reruns recognise finished items."""
+    normalized = f"{' '.join(role.lower().split())}\0{' '.join(query.lower().split())}"
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def read_items(path: str) -> Iterator[Dict[str, str]]:
+    """Yield {"id", "role", "query"} dicts from a JSONL or CSV file."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.lower().endswith(".csv"):
+            rows: Iterator[Dict[str, Any]] = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            role, query = (row.get("role") or "").strip(), (row.get("query") or "").strip()
+            if not role or not query:
+                print(f"Skipping row without role or query: {row}")
+                continue
+            yield {"id": str(row.get("id") or item_id(role, query)), "role": role, "query": query}
+
+
+class BatchOutput:
+    """Where finished trees go: one JSON file per tree in a directory, or lines of one JSONL file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_jsonl = path.lower().endswith(".jsonl")
+        self._lock = threading.Lock()
+        if self.is_jsonl:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._repair_tail()
+        else:
+            os.makedirs(path, exist_ok=True)
+
+    def _repair_tail(self) -> None:
+        """Terminate a line cut off by a crash so the next record starts on its own line."""
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def completed(self) -> Set[str]:
+        """Ids already written by an earlier run."""
+        if self.is_jsonl:
+            if not os.path.exists(self.path):
+                return set()
+            # TreeJournal.records() skips the corrupt line a crash may leave behind
+            return {record["id"] for record in TreeJournal(self.path).records() if "id" in record}
+        return {name[:-len(".json")] for name in os.listdir(self.path) if name.endswith(".json")}
+
+    def write(self, item: Dict[str, str], root: QuestionNode, run: Optional[Dict[str, Any]]) -> None:
+        if self.is_jsonl:
+            record = {**item, "model": LLM_MODEL, "run": run, "tree": root.to_dict()}
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            # Write then rename, so a crash never leaves a half-written tree that looks complete
+            final_path = os.path.join(self.path, f"{item['id']}.json")
+            temp_path = final_path + ".tmp"
+            if write_tree_snapshot(temp_path, root, item["role"], item["query"], LLM_MODEL):
+                os.replace(temp_path, final_path)
+
+
+class BatchRunner:
+    """Generates trees for a list of items on a worker pool, reporting progress as they finish."""
+
+    def __init__(self, client: Any, output: BatchOutput, workers: int, max_concurrency: int):
+        self.client = client
+        self.output = output
+        self.workers = max(1, workers)
+        # One limiter for the whole batch: total in-flight LLM calls never exceed max_concurrency
+        self.limiter = AdaptiveLimiter(max_concurrency, max_limit=max_concurrency)
+        self.cache = create_default_cache()
+        self.done = 0
+        self.failed = 0
+        self.questions = 0
+
+    def _generate(self, item: Dict[str, str]) -> Dict[str, Any]:
+        generator = DecisionTreeGenerator(
+            self.client, LLM_MODEL, max_workers=MAX_CONCURRENCY, persistence=PERSISTENCE_MODE,
+            cache=self.cache, priority=EXPANSION_PRIORITY, expansion_levels=EXPANSION_LEVELS,
+            reuse_subtrees=REUSE_SUBTREES, limiter=self.limiter, prompt_encoding=PROMPT_ENCODING
+        )
+        start = time.time()
+        root = generator.generate(item["role"], item["query"], budget=GenerationBudget.from_config())
+        self.output.write(item, root, generator.last_run)
+        return {"nodes": len(root.node_index), "seconds": time.time() - start, "run": generator.last_run}
+
+    def run(self, items: List[Dict[str, str]]) -> None:
+        total = len(items)
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            futures = {executor.submit(self._generate, item): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.failed += 1
+                    print(f"[{self.done + self.failed}/{total}] {item['id']} FAILED: {e}")
+                    continue
+                self.done += 1
+                self.questions += (result["run"] or {}).get("questions", 0) + 1
+                elapsed = time.time() - start
+                rate = self.done / elapsed
+                eta = (total - self.done - self.failed) / rate if rate else 0
+                print(f"[{self.done + self.failed}/{total}] {item['id']} {result['nodes']} nodes "
+                      f"in {result['seconds']:.1f}s | {rate * 60:.1f} trees/min, "
+                      f"{self.questions / elapsed:.1f} questions/s, ETA {eta:.0f}s")
+
+        elapsed = time.time() - start
+        print("-" * 50)
+        print(f"Finished {self.done} trees ({self.failed} failed) in {elapsed:.1f}s"
+              f" ({self.done / elapsed * 60 if elapsed else 0:.1f} trees/min)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="JSONL or CSV file of role/query pairs")
+    parser.add_argument("--output", required=True, help="Directory for <id>.json files, or a .jsonl file")
+    parser.add_argument("--workers", type=int, default=4, help="Trees generated at the same time")
+    parser.add_argument("--max-concurrency", type=int, default=16, help="Global limit on in-flight LLM calls")
+    args = parser.parse_args()
+
+    output = BatchOutput(args.output)
+    items = list(read_items(args.input))
+    completed = output.completed()
+    pending = [item for item in items if item["id"] not in completed]
+    # Duplicate rows would otherwise generate the same tree twice
+    unique = list({item["id"]: item for item in pending}.values())
+    print(f"{len(items)} items, {len(items) - len(pending)} already done, {len(unique)} to generate")
+    if not unique:
+        return
+
+    runner = BatchRunner(create_openai_client(), output, args.workers, args.max_concurrency)
+    runner.run(unique)
+
+    print("\nMetrics:")
+    print(metrics.summary(LLM_MODEL))
+
+
+if __name__ == "__main__":
+    main()
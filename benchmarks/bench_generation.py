@@ -0,0 +1,171 @@
+"""
+End-to-end generation benchmark on the offline fake LLM client.
+
+For each tree size (outcome count) and concurrency setting, generates full
+trees with recursive mode and reports:
+    - trees/sec and questions/sec
+    - p50 / p99 expansion latency (LLM call plus attach, persist and callback)
+    - serialization cost (to_dict + JSON dump, and load_tree_from_json)
+    - snapshot write time and size in the chosen log storage format
+    - memory of the finished tree (tracemalloc, bytes per node)
+    - prompt tokens per LLM call (the fake client counts 4 characters per token)
+
+Generation runs in a temporary directory, so logs/ is left untouched.
+
+Usage:
+    python benchmarks/bench_generation.py [--outcomes 8 32 128] [--workers 1 4 16]
+        [--branching 3] [--latency 0.01] [--jitter 0.01] [--trees 3] [--async]
+        [--prompt-encoding full|compact] [--log-storage full|compact] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tree import DecisionTreeGenerator, QuestionNode, load_tree_from_json, write_tree_snapshot  # noqa: E402
+from log_storage import COMPRESSED_EXTENSION  # noqa: E402
+from async_tree import AsyncDecisionTreeGenerator  # noqa: E402
+from fake_llm import FakeOpenAI, AsyncFakeOpenAI  # noqa: E402
+from prompt_encoding import prompt_savings  # noqa: E402
+
+ROLE = "Technical Troubleshooter"
+QUERY = "My computer screen keeps flickering."
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_case(args: argparse.Namespace, outcomes: int, workers: int) -> Dict[str, Any]:
+    options = dict(branching=args.branching, outcomes=outcomes, latency=args.latency, jitter=args.jitter)
+    expansion_times: List[float] = []
+    questions = 0
+    root = None
+
+    start = time.perf_counter()
+    for i in range(args.trees):
+        if args.use_async:
+            generator = AsyncDecisionTreeGenerator(
+                AsyncFakeOpenAI(seed=i, **options), "fake", max_workers=workers, persistence=args.persistence,
+                prompt_encoding=args.prompt_encoding, on_expansion=expansion_times.append
+            )
+            root = asyncio.run(generator.generate(ROLE, QUERY))
+        else:
+            generator = DecisionTreeGenerator(
+                FakeOpenAI(seed=i, **options), "fake", max_workers=workers, persistence=args.persistence,
+                prompt_encoding=args.prompt_encoding, on_expansion=expansion_times.append
+            )
+            root = generator.generate(ROLE, QUERY)
+        questions += 1 + generator.last_run["questions"]
+    elapsed = time.perf_counter() - start
+
+    node_count = sum(1 for _ in root.iter_subtree())
+    savings = prompt_savings(root)
+
+    start = time.perf_counter()
+    payload = json.dumps(root.to_dict())
+    dump_seconds = time.perf_counter() - start
+
+    extension = COMPRESSED_EXTENSION if args.log_storage == "compact" else ".json"
+    path = os.path.join(os.getcwd(), "bench_snapshot" + extension)
+    start = time.perf_counter()
+    write_tree_snapshot(path, root, ROLE, QUERY, "fake")
+    save_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    load_tree_from_json(path)
+    load_seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    copy = QuestionNode.from_dict(json.loads(payload))
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del copy
+
+    return {
+        "outcomes": outcomes,
+        "workers": workers,
+        "nodes": node_count,
+        "trees_per_sec": args.trees / elapsed,
+        "questions_per_sec": questions / elapsed,
+        "expansion_p50_ms": percentile(expansion_times, 50) * 1000,
+        "expansion_p99_ms": percentile(expansion_times, 99) * 1000,
+        "dump_ms": dump_seconds * 1000,
+        "load_ms": load_seconds * 1000,
+        "save_ms": save_seconds * 1000,
+        "snapshot_kb": os.path.getsize(path) / 1024,
+        "bytes_per_node": (after - before) / node_count,
+        "prompt_tokens_per_call": savings["prompt_tokens"] / savings["calls"] if savings["calls"] else 0.0,
+        "prompt_tokens_saved": savings["prompt_tokens_saved"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outcomes", type=int, nargs="+", default=[8, 32, 128], help="Tree sizes (root outcome count)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16], help="Concurrency settings")
+    parser.add_argument("--branching", type=int, default=3, help="Answers per question")
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake LLM seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Fake LLM extra seconds per call, up to this much")
+    parser.add_argument("--trees", type=int, default=3, help="Trees generated per case")
+    parser.add_argument("--persistence", choices=["journal", "snapshot"], default="journal")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Use AsyncDecisionTreeGenerator")
+    parser.add_argument("--prompt-encoding", choices=["full", "compact"], default="full")
+    parser.add_argument("--log-storage", choices=["full", "compact"], default="full")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json) if args.json else None
+    results = []
+    header = (f"{'outcomes':>8} {'workers':>7} {'nodes':>6} {'trees/s':>8} {'q/s':>8} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'dump ms':>8} {'save ms':>8} {'load ms':>8} {'snap KB':>8} "
+          f"{'B/node':>7} {'ptok/call':>9}")
+    print(header)
+    print("-" * len(header))
+
+    # Generation writes logs/ relative to the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for outcomes in args.outcomes:
+                for workers in args.workers:
+                    # The generator prints progress; keep the table readable
+                    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+                    try:
+                        result = run_case(args, outcomes, workers)
+                    finally:
+                        sys.stdout.close()
+                        sys.stdout = stdout
+                    results.append(result)
+                    print(f"{outcomes:>8} {workers:>7} {result['nodes']:>6} {result['trees_per_sec']:>8.2f} "
+                          f"{result['questions_per_sec']:>8.1f} {result['expansion_p50_ms']:>8.2f} "
+                          f"{result['expansion_p99_ms']:>8.2f} {result['dump_ms']:>8.2f} "
+                          f"{result['save_ms']:>8.2f} {result['load_ms']:>8.2f} {result['snapshot_kb']:>8.1f} "
+                          f"{result['bytes_per_node']:>7.0f} "
+                          f"{result['prompt_tokens_per_call']:>9.0f}")
+        finally:
+            os.chdir(cwd)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {json_path}")
+
+    print(f"\nMedian p50 expansion latency: {statistics.median(r['expansion_p50_ms'] for r in results):.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Memory benchmark: bytes per node for large in-memory decision trees.
+
+Builds synthetic trees the way the generator does (one parsed response per
+question, so outcome strings arrive as fresh objects) and measures the
+allocated size with tracemalloc.
+
+Usage:
+    python benchmarks/bench_memory.py [--depth 7] [--branching 3] [--outcomes 12]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tree import QuestionNode  # noqa: E402
+
+
+def build_tree(depth: int, branching: int, outcome_count: int) -> QuestionNode:
+    """Build a full tree of the given depth where every answer shares the same outcome pool."""
+    outcomes = [f"Possible outcome number {i} for this query" for i in range(outcome_count)]
+
+    def parsed_outcomes() -> list:
+        # json.loads mimics a fresh LLM response: equal strings, distinct objects
+        return json.loads(json.dumps(outcomes[: max(2, outcome_count // 2)]))
+
+    root = QuestionNode("What is the most useful first question?")
+    frontier = [root]
+    for level in range(depth):
+        next_frontier = []
+        for question in frontier:
+            for i in range(branching):
+                answer = question.add_answer(f"Answer option {i} at level {level}", parsed_outcomes())
+                if level < depth - 1:
+                    child = QuestionNode(f"Follow-up question at level {level + 1}")
+                    answer.set_child(child)
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return root
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--depth", type=int, default=7, help="Number of question levels")
+    parser.add_argument("--branching", type=int, default=3, help="Answers per question")
+    parser.add_argument("--outcomes", type=int, default=12, help="Size of the outcome pool")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    root = build_tree(args.depth, args.branching, args.outcomes)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    node_count = sum(1 for _ in root.iter_subtree()) if hasattr(root, "iter_subtree") else None
+    if node_count is None:
+        # Older trees without iter_subtree: count with a manual walk
+        node_count, stack = 0, [root]
+        while stack:
+            node = stack.pop()
+            node_count += 1
+            stack.extend(getattr(node, "answers", []))
+            if getattr(node, "child", None):
+                stack.append(node.child)
+
+    total = after - before
+    print(f"Nodes:          {node_count}")
+    print(f"Total bytes:    {total}")
+    print(f"Bytes per node: {total / node_count:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Content-addressed cache for structured LLM responses."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """
+    Caches parsed LLM responses keyed on a hash of the model and rendered prompts.
+
+    The in-memory tier is an LRU with optional TTL. If db_path is given, entries
+    are also written to a SQLite table so they survive restarts; memory misses
+    fall through to it and are promoted back into memory on a hit.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created_at REAL, response TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str) -> str:
+        """Hash the inputs that fully determine a response."""
+        payload = json.dumps([model, system_prompt, user_prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached response for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, response = entry
+                if not self._expired(created_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created_at, response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row and not self._expired(row[0]):
+                    response = json.loads(row[1])
+                    self._store(key, row[0], response)
+                    self.hits += 1
+                    return response
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: Dict[str, Any]) -> None:
+        """Store a response in memory and, if configured, on disk."""
+        created_at = time.time()
+        with self._lock:
+            self._store(key, created_at, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, created_at, response) VALUES (?, ?, ?)",
+                    (key, created_at, json.dumps(response, ensure_ascii=False)),
+                )
+                self._db.commit()
+
+    def _store(self, key: str, created_at: float, response: Dict[str, Any]) -> None:
+        self._entries[key] = (created_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+def create_default_cache() -> Optional[ResponseCache]:
+    """Build the process-wide cache from config, or None if caching is disabled."""
+    from config import CACHE_MAX_SIZE, CACHE_TTL_SECONDS, CACHE_DB_PATH
+
+    if CACHE_MAX_SIZE <= 0:
+        return None
+    return ResponseCache(
+        max_size=CACHE_MAX_SIZE,
+        ttl_seconds=CACHE_TTL_SECONDS or None,
+        db_path=CACHE_DB_PATH or None,
+    )
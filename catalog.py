@@ -0,0 +1,186 @@
+"""
+Catalog of the trees saved in logs/, indexed in SQLite by normalized role and
+query so a question that was already answered can be served without any LLM
+calls.
+
+Generators given a catalog record every snapshot they write; trees saved by
+other processes are picked up by refresh(), which only re-reads files whose
+size or modification time changed.
+"""
+
+import difflib
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from tree import QuestionNode, is_complete, load_tree_from_json
+from log_storage import SNAPSHOT_EXTENSIONS, snapshot_base
+
+
+def normalize(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form used as lookup key."""
+    return " ".join(re.findall(r"\w+", text.casefold()))
+
+
+class TreeCatalog:
+    """
+    SQLite index of saved tree snapshots.
+
+    lookup() matches the normalized role exactly and the normalized query
+    exactly or, if fuzzy_threshold > 0, by difflib similarity ratio of at least
+    that threshold. Among matches, complete trees, then larger, then newer
+    trees win.
+    """
+
+    def __init__(self, db_path: str = "logs/catalog.sqlite3", logs_dir: str = "logs", fuzzy_threshold: float = 0.0):
+        self.db_path = db_path
+        self.logs_dir = logs_dir
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS trees ("
+            "path TEXT PRIMARY KEY, tree_id TEXT, role TEXT, query TEXT, role_key TEXT, query_key TEXT, "
+            "model TEXT, created_at REAL, nodes INTEGER, complete INTEGER, size INTEGER, mtime REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS trees_key ON trees (role_key, query_key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS trees_tree_id ON trees (tree_id)")
+        self._db.commit()
+
+    def add(
+        self, path: str, root: QuestionNode, role: str, query: str, model: str,
+        nodes: Optional[int] = None, complete: Optional[bool] = None,
+    ) -> None:
+        """
+        Record a snapshot that was just written to path. nodes and complete, if
+        given, are used instead of reading root (which may have changed since).
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        if nodes is None:
+            nodes = len(root.node_index)
+        if complete is None:
+            complete = is_complete(root)
+        row = (
+            path, root.id, role, query, normalize(role), normalize(query), model, root.created_at,
+            nodes, int(complete), stat.st_size, stat.st_mtime
+        )
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO trees VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self._db.commit()
+
+    def refresh(self) -> int:
+        """Index new or changed snapshots in logs_dir and drop deleted ones. Returns files indexed."""
+        if not os.path.isdir(self.logs_dir):
+            return 0
+        with self._lock:
+            known = {
+                row["path"]: (row["size"], row["mtime"])
+                for row in self._db.execute("SELECT path, size, mtime FROM trees")
+            }
+        seen = set()
+        indexed = 0
+        for name in os.listdir(self.logs_dir):
+            if not name.endswith(SNAPSHOT_EXTENSIONS):
+                continue
+            path = os.path.join(self.logs_dir, name)
+            # A journal next to the snapshot means the tree is still being written (or was not compacted)
+            if os.path.exists(snapshot_base(path) + ".journal.jsonl"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            seen.add(path)
+            if known.get(path) == (stat.st_size, stat.st_mtime):
+                continue
+            try:
+                root, meta = load_tree_from_json(path)
+            except Exception as e:
+                print(f"Skipping {path} in tree catalog: {e}")
+                continue
+            if not meta.get("role") or not meta.get("query"):
+                continue
+            self.add(path, root, meta["role"], meta["query"], meta.get("model", ""))
+            indexed += 1
+        with self._lock:
+            for path in set(known) - seen:
+                self._db.execute("DELETE FROM trees WHERE path = ?", (path,))
+            self._db.commit()
+        return indexed
+
+    def lookup(self, role: str, query: str, complete_only: bool = True) -> Optional[Dict[str, Any]]:
+        """Best stored tree for role and query, as a dict of catalog columns, or None."""
+        role_key, query_key = normalize(role), normalize(query)
+        sql = "SELECT * FROM trees WHERE role_key = ?"
+        params: List[Any] = [role_key]
+        if complete_only:
+            sql += " AND complete = 1"
+        if self.fuzzy_threshold <= 0:
+            sql += " AND query_key = ?"
+            params.append(query_key)
+        with self._lock:
+            rows = [dict(row) for row in self._db.execute(sql, params)]
+        best, best_key = None, None
+        for row in rows:
+            score = 1.0 if row["query_key"] == query_key else difflib.SequenceMatcher(
+                None, row["query_key"], query_key
+            ).ratio()
+            if score < 1.0 and score < self.fuzzy_threshold:
+                continue
+            key = (score, row["complete"], row["nodes"], row["created_at"])
+            if best_key is None or key > best_key:
+                best, best_key = row, key
+        if best is not None:
+            best["score"] = best_key[0]
+        return best
+
+    def get(self, tree_id: str) -> Optional[Dict[str, Any]]:
+        """Catalog entry of a tree by its root id, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM trees WHERE tree_id = ? ORDER BY complete DESC, nodes DESC LIMIT 1", (tree_id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def load(self, entry: Dict[str, Any]) -> Optional[QuestionNode]:
+        """Load a lookup() result back into nodes; forgets the entry if its file is gone or broken."""
+        try:
+            root, _ = load_tree_from_json(entry["path"])
+            return root
+        except Exception as e:
+            print(f"Error loading cataloged tree {entry['path']}: {e}")
+            with self._lock:
+                self._db.execute("DELETE FROM trees WHERE path = ?", (entry["path"],))
+                self._db.commit()
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total, complete = self._db.execute("SELECT COUNT(*), COALESCE(SUM(complete), 0) FROM trees").fetchone()
+        return {"trees": total, "complete": complete, "fuzzy_threshold": self.fuzzy_threshold}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def create_default_catalog() -> Optional[TreeCatalog]:
+    """Build the catalog from config and index logs/, or None if the catalog is disabled."""
+    from config import CATALOG_ENABLED, CATALOG_DB_PATH, CATALOG_FUZZY_THRESHOLD
+
+    if not CATALOG_ENABLED:
+        return None
+    catalog = TreeCatalog(CATALOG_DB_PATH, fuzzy_threshold=CATALOG_FUZZY_THRESHOLD)
+    indexed = catalog.refresh()
+    if indexed:
+        print(f"Tree catalog: indexed {indexed} saved trees")
+    return catalog
@@ -0,0 +1,58 @@
+"""Factories for the long-lived OpenAI clients shared within a process."""
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+
+from config import (
+    BASE_URL, API_KEY, HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    LLM_BACKEND, FAKE_LLM_BRANCHING, FAKE_LLM_OUTCOMES, FAKE_LLM_LATENCY, FAKE_LLM_JITTER, FAKE_LLM_REPLAY
+)
+
+
+def _fake_client_options() -> dict:
+    return {
+        "branching": FAKE_LLM_BRANCHING,
+        "outcomes": FAKE_LLM_OUTCOMES,
+        "latency": FAKE_LLM_LATENCY,
+        "jitter": FAKE_LLM_JITTER,
+        "replay": FAKE_LLM_REPLAY or None,
+    }
+
+
+def create_openai_client() -> OpenAI:
+    """
+    Create an OpenAI client with a keep-alive connection pool.
+    Create one per process and share it: the client is thread-safe, and reusing
+    it avoids a new connection pool and TLS handshake per request.
+    With LLM_BACKEND=fake, returns the offline FakeOpenAI instead.
+    """
+    if LLM_BACKEND == "fake":
+        from fake_llm import FakeOpenAI
+        return FakeOpenAI(**_fake_client_options())
+
+    # DefaultHttpxClient keeps the SDK's default timeouts and redirect handling
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+    )
+    # Retries are handled by ratelimit.call_with_retry, which also feeds the adaptive limiter
+    return OpenAI(base_url=BASE_URL, api_key=API_KEY, http_client=http_client, max_retries=0)
+
+
+def create_async_openai_client() -> AsyncOpenAI:
+    """Async counterpart of create_openai_client, for use on an event loop."""
+    if LLM_BACKEND == "fake":
+        from fake_llm import AsyncFakeOpenAI
+        return AsyncFakeOpenAI(**_fake_client_options())
+
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+    )
+    return AsyncOpenAI(base_url=BASE_URL, api_key=API_KEY, http_client=http_client, max_retries=0)
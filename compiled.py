@@ -0,0 +1,191 @@
+"""
+Compiled, read-only tree files for serving finished trees.
+
+A compiled tree is a flat little-endian file: a header, fixed-size question and
+answer records that refer to each other by integer index, an array of outcome
+string ids, and one string table (offsets plus UTF-8 blob) in which repeated
+outcomes are stored once. Files are memory-mapped, so opening one costs a few
+page reads and every process serving the same tree shares one copy in the OS
+page cache.
+
+Question 0 is the root. Usage:
+    python compiled.py logs/<tree>.json [--output <tree>.ctree]
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from tree import QuestionNode, load_tree_from_json
+from log_storage import snapshot_base
+
+MAGIC = b"LDTC"
+VERSION = 1
+EXTENSION = ".ctree"
+
+# magic, version, questions, answers, outcome refs, strings, then string ids of tree id, role, query, model
+_HEADER = struct.Struct("<4sIIIIIIIII")
+# node id, question text, first answer, answer count
+_QUESTION = struct.Struct("<IIII")
+# node id, answer text, child question (-1 if none), first outcome ref, outcome count
+_ANSWER = struct.Struct("<IIiII")
+_U32 = struct.Struct("<I")
+
+
+def compiled_path(json_path: str) -> str:
+    """Where the compiled form of a logs/*.json or *.json.gz snapshot lives."""
+    return snapshot_base(json_path) + EXTENSION
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.strings: List[bytes] = []
+
+    def add(self, text: str) -> int:
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text.encode("utf-8"))
+        return string_id
+
+
+def compile_tree(root: QuestionNode, path: str, role: str, query: str, model: str) -> int:
+    """Write root's tree to path in compiled form. Returns the file size in bytes."""
+    strings = _StringTable()
+    questions: List[bytes] = []
+    answers: List[bytes] = []
+    outcome_refs: List[int] = []
+
+    # Breadth-first, numbering each question when it is queued so answers know their child's index
+    pending = deque([root])
+    queued = 1
+    while pending:
+        question = pending.popleft()
+        questions.append(_QUESTION.pack(
+            strings.add(question.id), strings.add(question.question), len(answers), len(question.answers)
+        ))
+        for answer in question.answers:
+            child_index = -1
+            if answer.child is not None:
+                child_index = queued
+                queued += 1
+                pending.append(answer.child)
+            answers.append(_ANSWER.pack(
+                strings.add(answer.id), strings.add(answer.answer_text), child_index,
+                len(outcome_refs), len(answer.potential_outcomes)
+            ))
+            outcome_refs.extend(strings.add(outcome) for outcome in answer.potential_outcomes)
+
+    meta_ids = [strings.add(root.id), strings.add(role), strings.add(query), strings.add(model)]
+    offsets = [0]
+    for data in strings.strings:
+        offsets.append(offsets[-1] + len(data))
+
+    header = _HEADER.pack(
+        MAGIC, VERSION, len(questions), len(answers), len(outcome_refs), len(strings.strings), *meta_ids
+    )
+    # Unique temp name: other workers may compile the same tree, and readers keep their old mapping
+    temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(b"".join(questions))
+        f.write(b"".join(answers))
+        f.write(struct.pack(f"<{len(outcome_refs)}I", *outcome_refs))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(b"".join(strings.strings))
+    os.replace(temp_path, path)
+    return os.path.getsize(path)
+
+
+class CompiledTree:
+    """Read-only view of a compiled tree file; questions are addressed by integer index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.question_count, self.answer_count, outcome_count,
+         string_count, *meta_ids) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"Not a compiled tree (version {VERSION}): {path}")
+        self._questions = _HEADER.size
+        self._answers = self._questions + self.question_count * _QUESTION.size
+        self._outcomes = self._answers + self.answer_count * _ANSWER.size
+        self._offsets = self._outcomes + outcome_count * _U32.size
+        self._blob = self._offsets + (string_count + 1) * _U32.size
+        self.tree_id, self.role, self.query, self.model = (self._string(i) for i in meta_ids)
+
+    def __len__(self) -> int:
+        return self.question_count
+
+    def _string(self, string_id: int) -> str:
+        start, end = struct.unpack_from("<II", self._map, self._offsets + string_id * _U32.size)
+        return self._map[self._blob + start:self._blob + end].decode("utf-8")
+
+    def _question(self, index: int) -> tuple:
+        if not 0 <= index < self.question_count:
+            raise IndexError(f"Question index out of range: {index}")
+        return _QUESTION.unpack_from(self._map, self._questions + index * _QUESTION.size)
+
+    def _answer(self, index: int) -> tuple:
+        return _ANSWER.unpack_from(self._map, self._answers + index * _ANSWER.size)
+
+    def question(self, index: int) -> Dict[str, Any]:
+        """One question and its answers; "next" is the index of an answer's follow-up question."""
+        node_id, text, first_answer, answer_count = self._question(index)
+        answers = []
+        for position in range(answer_count):
+            answer_id, answer_text, child, first_outcome, outcome_count = self._answer(first_answer + position)
+            refs = struct.unpack_from(f"<{outcome_count}I", self._map, self._outcomes + first_outcome * _U32.size)
+            answers.append({
+                "id": self._string(answer_id),
+                "text": self._string(answer_text),
+                "outcomes": [self._string(ref) for ref in refs],
+                "next": child if child >= 0 else None,
+            })
+        return {"index": index, "id": self._string(node_id), "question": self._string(text), "answers": answers}
+
+    def child(self, index: int, position: int) -> Optional[int]:
+        """Index of the question after choosing answer number position of question index, or None."""
+        _, _, first_answer, answer_count = self._question(index)
+        if not 0 <= position < answer_count:
+            raise IndexError(f"Answer position out of range: {position}")
+        child = self._answer(first_answer + position)[2]
+        return child if child >= 0 else None
+
+    def navigate(self, positions: Iterable[int]) -> Optional[int]:
+        """Follow answer positions from the root; None if the path ends at a leaf answer."""
+        index: Optional[int] = 0
+        for position in positions:
+            if index is None:
+                raise IndexError("Path continues past a leaf answer")
+            index = self.child(index, position)
+        return index
+
+    def close(self) -> None:
+        self._map.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Tree snapshot (logs/*.json or *.json.gz)")
+    parser.add_argument("--output", help=f"Compiled file (default: input with {EXTENSION})")
+    args = parser.parse_args()
+
+    root, meta = load_tree_from_json(args.input)
+    output = args.output or compiled_path(args.input)
+    size = compile_tree(root, output, meta.get("role", ""), meta.get("query", ""), meta.get("model", ""))
+    compiled = CompiledTree(output)
+    print(f"Compiled {len(compiled)} questions, {compiled.answer_count} answers into {output}: "
+          f"{size} bytes ({os.path.getsize(args.input)} bytes as JSON)")
+    compiled.close()
+
+
+if __name__ == "__main__":
+    main()
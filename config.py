@@ -11,8 +11,77 @@ BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 API_KEY = os.getenv("OPENAI_API_KEY", "")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-5.1")
 
+# "openai", or "fake" for the offline synthetic client in fake_llm.py (no API calls)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+FAKE_LLM_BRANCHING = int(os.getenv("FAKE_LLM_BRANCHING", "3"))  # Answers per question
+FAKE_LLM_OUTCOMES = int(os.getenv("FAKE_LLM_OUTCOMES", "12"))  # Outcomes proposed by the root question
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))  # Seconds per call
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0"))  # Extra seconds per call, up to this much
+FAKE_LLM_REPLAY = os.getenv("FAKE_LLM_REPLAY", "")  # e.g. "logs/*.json*" to replay recorded responses
+
 # Tree Building Parameters
 MAX_DEPTH = 10  # Maximum tree depth to prevent infinite recursion
+INTERN_OUTCOMES = True  # Share one copy of each repeated outcome string across nodes
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))  # Max in-flight LLM calls in recursive mode
+
+# Process-wide adaptive limit on in-flight LLM calls (grows on success, halves on 429s/timeouts)
+RATE_LIMIT_INITIAL = int(os.getenv("RATE_LIMIT_INITIAL", "8"))
+RATE_LIMIT_MIN = int(os.getenv("RATE_LIMIT_MIN", "1"))
+RATE_LIMIT_MAX = int(os.getenv("RATE_LIMIT_MAX", "64"))
+# Retries of transient errors (429, timeouts, connection errors, 5xx), with jittered exponential backoff
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))  # Seconds
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))  # Seconds
+EXPANSION_PRIORITY = os.getenv("EXPANSION_PRIORITY", "outcomes")  # "outcomes", "shallow" or "deep"
+EXPANSION_LEVELS = int(os.getenv("EXPANSION_LEVELS", "1"))  # Question levels per LLM call; 2-3 saves round-trips
+REUSE_SUBTREES = os.getenv("REUSE_SUBTREES", "0") == "1"  # Copy branches with identical outcome sets
+LOG_STORAGE = os.getenv("LOG_STORAGE", "full")  # "full" (indented .json) or "compact" (gzipped .json.gz, prompt templates stored once)
+PROMPT_ENCODING = os.getenv("PROMPT_ENCODING", "full")  # "full" or "compact" (fewer prompt tokens, shared prefixes)
+STREAM_PARTIAL = os.getenv("STREAM_PARTIAL", "0") == "1"  # Web server: stream expansions, sending "partial_expand" events
+
+# Recursive generation budget per tree (0 = unlimited). Unexpanded answers are marked for resume.
+BUDGET_MAX_TOKENS = int(os.getenv("BUDGET_MAX_TOKENS", "0"))
+BUDGET_MAX_REQUESTS = int(os.getenv("BUDGET_MAX_REQUESTS", "0"))
+BUDGET_MAX_SECONDS = float(os.getenv("BUDGET_MAX_SECONDS", "0"))
+
+# Speculative prefetch in interactive mode: expand likely next answers in the background
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "0") == "1"
+SPECULATION_FANOUT = int(os.getenv("SPECULATION_FANOUT", "3"))  # Answers per question to prefetch
+SPECULATION_DEPTH = int(os.getenv("SPECULATION_DEPTH", "1"))  # Levels to prefetch ahead
+SPECULATION_TOKEN_BUDGET = int(os.getenv("SPECULATION_TOKEN_BUDGET", "20000"))  # Per tree
+
+# Persistence: "snapshot" (default) rewrites the full JSON each time, "journal" appends one record per expansion.
+# Journaled trees get their logs/ snapshot and catalog entry only when compacted or evicted.
+PERSISTENCE_MODE = os.getenv("PERSISTENCE_MODE", "snapshot")
+
+# Shared HTTP connection pool for the LLM client
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Web server: asyncio tasks running /generate and /expand at once (BoundedTaskRunner), and how many may wait for one
+SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", "16"))
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", "64"))
+
+# Websocket delivery: events queued per client, and what to do when a client falls behind
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+WS_SLOW_CLIENT_POLICY = os.getenv("WS_SLOW_CLIENT_POLICY", "drop_oldest")  # "drop_oldest", "drop_newest" or "disconnect"
+# Recent events kept per tree (and trees kept) so reconnecting clients can catch up
+WS_REPLAY_EVENTS = int(os.getenv("WS_REPLAY_EVENTS", "512"))
+WS_REPLAY_TREES = int(os.getenv("WS_REPLAY_TREES", "1000"))
+
+# Web server: total nodes kept in memory across trees before idle trees are evicted to logs/
+TREE_STORE_MAX_NODES = int(os.getenv("TREE_STORE_MAX_NODES", "50000"))
+
+# Response cache: in-memory LRU, optionally backed by a SQLite file
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1024"))  # 0 disables the cache
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "86400"))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")  # e.g. "logs/cache.sqlite3"
+
+# Catalog of saved trees: serve a stored tree for a role/query that was already generated
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "0") == "1"
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "logs/catalog.sqlite3")
+CATALOG_FUZZY_THRESHOLD = float(os.getenv("CATALOG_FUZZY_THRESHOLD", "0"))  # 0 = exact match only, e.g. 0.9
 
 # Predefined Roles
 PREDEFINED_ROLES = [
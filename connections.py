@@ -0,0 +1,271 @@
+"""
+Websocket fan-out for the web server: per-tree subscriptions, and one bounded
+outbound queue plus writer task per connection so a slow client never delays
+the others.
+
+Tree events carry a per-tree sequence number ("seq") and the latest ones are
+kept in a ring buffer, so a client that reconnects (or notices a gap) can
+subscribe with the last seq it saw and catch up without regenerating.
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+SLOW_CLIENT_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+
+class TreeEvents:
+    """Sequence counter and ring buffer of the most recent events of one tree."""
+
+    def __init__(self, max_events: int, seq: int = 0, complete: bool = False):
+        self.seq = seq
+        self.complete = complete
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max(1, max_events))
+
+    def append(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Return a copy of message stamped with the next seq, and buffer it."""
+        self.seq += 1
+        message = {**message, "seq": self.seq}
+        self.events.append(message)
+        if message.get("type") == "complete":
+            self.complete = True
+        return message
+
+    def since(self, last_seq: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Events after last_seq, or None if some of them already left the buffer or
+        last_seq is ahead of this tree (the client saw an older numbering, e.g. before a restart).
+        """
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        oldest = self.events[0]["seq"] if self.events else self.seq + 1
+        if last_seq + 1 < oldest:
+            return None
+        return [message for message in self.events if message["seq"] > last_seq]
+
+
+class ClientConnection:
+    """One websocket with its subscriptions, outbound queue and writer task."""
+
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.id = str(uuid.uuid4())
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self.trees: Set[str] = set()
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self.writer = asyncio.get_running_loop().create_task(self._write())
+
+    def offer(self, message: Dict[str, Any], policy: str) -> bool:
+        """Queue a message without waiting. Returns False if the client should be disconnected."""
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        if policy == "disconnect":
+            return False
+        if policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+        return True
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                message = await self.queue.get()
+                await self.websocket.send_json(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The receive loop in the endpoint notices the disconnect and cleans up
+            print(f"Error sending to websocket: {e}")
+
+    async def close(self, code: int = 1000) -> None:
+        if self.writer is not None:
+            self.writer.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    """
+    Routes events to the connections subscribed to their tree_id (events without
+    a tree_id go to everyone). broadcast() only enqueues, so its cost scales with
+    the subscribers of a tree and never waits on a socket.
+
+    When a client's queue is full, policy decides what happens: "drop_oldest"
+    discards its oldest queued event, "drop_newest" discards the new one and
+    "disconnect" closes the connection.
+
+    The last replay_events events of up to replay_trees trees are kept for
+    resubscribing clients. When a client is further behind than that (or than
+    its queue can hold), it gets {"type": "snapshot"} with the tree from
+    snapshot(tree_id) instead, if a snapshot function is given. A tree whose
+    buffer is evicted keeps its seq and completion (in evicted), so its numbering
+    continues where it left off.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 256,
+        policy: str = "drop_oldest",
+        replay_events: int = 512,
+        replay_trees: int = 1000,
+        snapshot: Optional[Callable[[str], Optional[Dict[str, Any]]]] = None,
+    ):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.replay_events = replay_events
+        self.replay_trees = replay_trees
+        self.snapshot = snapshot
+        self.connections: Dict[str, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.history: "OrderedDict[str, TreeEvents]" = OrderedDict()
+        # (seq, complete) of trees whose buffer was evicted
+        self.evicted: Dict[str, tuple] = {}
+        self.slow_disconnects = 0
+        self.replayed = 0
+        self.snapshots = 0
+
+    async def connect(self, websocket: WebSocket) -> ClientConnection:
+        await websocket.accept()
+        connection = ClientConnection(websocket, self.max_queue)
+        self.connections[connection.id] = connection
+        connection.start()
+        # Lets the page pass its connection id to /generate, subscribing before the first event
+        connection.offer({"type": "hello", "connection_id": connection.id}, self.policy)
+        return connection
+
+    def disconnect(self, connection: ClientConnection) -> None:
+        if self.connections.pop(connection.id, None) is None:
+            return
+        for tree_id in connection.trees:
+            subscribers = self.subscribers.get(tree_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.subscribers[tree_id]
+        connection.trees.clear()
+        if connection.writer is not None:
+            connection.writer.cancel()
+
+    def subscribe(self, connection_id: Optional[str], tree_id: str, last_seq: Optional[int] = None) -> bool:
+        """
+        Subscribe a connection to a tree's events. Returns False for unknown connections.
+        With last_seq, the events after it are queued first (or a snapshot, if they are gone).
+        """
+        connection = self.connections.get(connection_id) if connection_id else None
+        if connection is None:
+            return False
+        connection.trees.add(tree_id)
+        self.subscribers.setdefault(tree_id, set()).add(connection)
+        if last_seq is not None:
+            self._resync(connection, tree_id, last_seq)
+        return True
+
+    def _resync(self, connection: ClientConnection, tree_id: str, last_seq: int) -> None:
+        history = self.history.get(tree_id)
+        missed = history.since(last_seq) if history is not None else None
+        if missed is not None and len(missed) <= self.max_queue:
+            self.replayed += len(missed)
+            for message in missed:
+                if not self._deliver(connection, message):
+                    break
+            return
+        tree = self.snapshot(tree_id) if self.snapshot is not None else None
+        if tree is not None:
+            self._send_snapshot(connection, tree_id, tree)
+
+    def send_snapshot(self, connection_id: Optional[str], tree_id: str, tree: Dict[str, Any], complete: bool = False) -> bool:
+        """Send a tree to one connection only, as a snapshot event. Returns False for unknown connections."""
+        connection = self.connections.get(connection_id) if connection_id else None
+        if connection is None:
+            return False
+        self._send_snapshot(connection, tree_id, tree, complete)
+        return True
+
+    def _send_snapshot(
+        self, connection: ClientConnection, tree_id: str, tree: Dict[str, Any], complete: bool = False
+    ) -> None:
+        self.snapshots += 1
+        history = self.history.get(tree_id)
+        if history is not None:
+            seq, stored_complete = history.seq, history.complete
+        else:
+            seq, stored_complete = self.evicted.get(tree_id, (0, False))
+        self._deliver(connection, {
+            "type": "snapshot",
+            "tree_id": tree_id,
+            # Events after this seq are not reflected in the snapshot
+            "seq": seq,
+            "complete": complete or stored_complete,
+            "tree": tree,
+        })
+
+    def _record(self, tree_id: str, message: Dict[str, Any]) -> Dict[str, Any]:
+        history = self.history.get(tree_id)
+        if history is None:
+            seq, complete = self.evicted.pop(tree_id, (0, False))
+            history = self.history[tree_id] = TreeEvents(self.replay_events, seq, complete)
+            while len(self.history) > self.replay_trees:
+                evicted_id, evicted = self.history.popitem(last=False)
+                self.evicted[evicted_id] = (evicted.seq, evicted.complete)
+        self.history.move_to_end(tree_id)
+        return history.append(message)
+
+    def unsubscribe(self, connection_id: str, tree_id: str) -> None:
+        connection = self.connections.get(connection_id)
+        if connection is None:
+            return
+        connection.trees.discard(tree_id)
+        subscribers = self.subscribers.get(tree_id)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.subscribers[tree_id]
+
+    async def broadcast(self, message: dict):
+        tree_id = message.get("tree_id")
+        if tree_id:
+            message = self._record(tree_id, message)
+        targets = self.subscribers.get(tree_id, ()) if tree_id else self.connections.values()
+        for connection in list(targets):
+            self._deliver(connection, message)
+
+    def _deliver(self, connection: ClientConnection, message: Dict[str, Any]) -> bool:
+        """Queue a message for one client, disconnecting it if it is too slow."""
+        if connection.offer(message, self.policy):
+            return True
+        print(f"Disconnecting slow websocket client {connection.id}")
+        self.slow_disconnects += 1
+        self.disconnect(connection)
+        # 1013: try again later
+        asyncio.get_running_loop().create_task(connection.close(code=1013))
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self.connections),
+            "subscribed_trees": len(self.subscribers),
+            "queued": sum(c.queue.qsize() for c in self.connections.values()),
+            "dropped": sum(c.dropped for c in self.connections.values()),
+            "slow_disconnects": self.slow_disconnects,
+            "replay_trees": len(self.history),
+            "replayed": self.replayed,
+            "snapshots": self.snapshots,
+            "policy": self.policy,
+        }
@@ -0,0 +1,260 @@
+"""
+Offline stand-in for the OpenAI client.
+
+FakeOpenAI and AsyncFakeOpenAI answer client.beta.chat.completions.parse()
+(and .stream()) with deterministic synthetic questions, so trees can be
+generated and timed without a live API. Responses recorded in logs/ can be
+replayed instead.
+"""
+
+import asyncio
+import glob
+import hashlib
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from pydantic import BaseModel
+
+from persistence import TreeJournal
+from log_storage import load_snapshot
+
+# Outcome lines of DISCRIMINATING_USER_PROMPT and the level count of SUBTREE_SYSTEM_PROMPT
+_OUTCOME_LINE = re.compile(r"^- (.*)$", re.M)
+_LEVELS = re.compile(r"next (\d+) levels")
+# Outcome lines of COMPACT_DISCRIMINATING_USER_PROMPT ("- O1a2: text"), answered with the ids
+_CODED_OUTCOME = re.compile(r"^(O[0-9a-f]+): ")
+
+
+class _FakeBackend:
+    """Builds responses and latencies; shared by the sync and async clients."""
+
+    def __init__(
+        self,
+        branching: int = 3,
+        outcomes: int = 12,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0,
+        replay: Optional[str] = None,
+        max_in_flight: int = 0,
+        retry_after: float = 1.0,
+    ):
+        """
+        Args:
+            branching: Answers per question (fewer when fewer outcomes are left).
+            outcomes: Size of the outcome set proposed by the root question.
+            latency: Base seconds per call.
+            jitter: Extra seconds per call, uniformly spread in [0, jitter]
+                    and derived from the prompt, so reruns sleep the same.
+            seed: Changes question wording and jitter between otherwise equal runs.
+            replay: Glob of logs/*.json(.gz) snapshots or *.journal.jsonl journals whose
+                    recorded responses are returned for matching prompts.
+            max_in_flight: Simulated provider limit; calls beyond this many at once
+                    fail with a 429 RateLimitError. 0 disables throttling.
+            retry_after: Retry-After seconds sent with simulated 429s.
+        """
+        self.branching = max(2, branching)
+        self.outcomes = max(1, outcomes)
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.calls = 0
+        self.replayed = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._recorded: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if replay:
+            for path in sorted(glob.glob(replay)):
+                self._load_recording(path)
+
+    def _load_recording(self, path: str) -> None:
+        if path.endswith(".jsonl"):
+            logs = []
+            for record in TreeJournal(path).records():
+                if record.get("log"):
+                    logs.append(record["log"])
+                logs.extend(record.get("logs", []))
+        else:
+            logs = load_snapshot(path).get("logs", [])
+        for log in logs:
+            self._recorded[(log["system_prompt"], log["user_prompt"])] = log["response"]
+
+    def begin(self) -> None:
+        """Admit a call, or raise a 429 if the simulated provider limit is reached."""
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.throttled += 1
+                request = httpx.Request("POST", "https://fake-llm.invalid/v1/chat/completions")
+                response = httpx.Response(429, headers={"retry-after": str(self.retry_after)}, request=request)
+                raise openai.RateLimitError("Rate limit reached (fake)", response=response, body=None)
+            self.in_flight += 1
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def respond(self, messages: List[Dict[str, str]], response_format: type[BaseModel]) -> Tuple[Any, float]:
+        """Return the completion object for one call and how long to sleep before returning it."""
+        system_prompt, user_prompt = messages[0]["content"], messages[-1]["content"]
+        digest = hashlib.sha256(f"{self.seed}\0{system_prompt}\0{user_prompt}".encode()).digest()
+
+        recorded = self._recorded.get((system_prompt, user_prompt))
+        with self._lock:
+            self.calls += 1
+            if recorded is not None:
+                self.replayed += 1
+        if recorded is not None:
+            parsed = response_format.model_validate(recorded)
+        else:
+            outcomes = _OUTCOME_LINE.findall(user_prompt) or [f"Outcome {i + 1}" for i in range(self.outcomes)]
+            codes = [_CODED_OUTCOME.match(outcome) for outcome in outcomes]
+            if all(codes):
+                outcomes = [code.group(1) for code in codes]
+            levels = _LEVELS.search(system_prompt)
+            data = self._question(outcomes, int(levels.group(1)) if levels else 1, digest.hex()[:8])
+            parsed = response_format.model_validate(data)
+
+        prompt_tokens = (len(system_prompt) + len(user_prompt)) // 4
+        completion_tokens = len(parsed.model_dump_json()) // 4
+        completion = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(parsed=parsed, refusal=None))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+        delay = self.latency + self.jitter * digest[0] / 255
+        return completion, delay
+
+    def _question(self, outcomes: List[str], levels: int, tag: str) -> Dict[str, Any]:
+        """Split outcomes into contiguous groups, nesting follow-ups for multi-level calls."""
+        groups = min(self.branching, len(outcomes))
+        size, extra = divmod(len(outcomes), groups)
+        answers = []
+        start = 0
+        for i in range(groups):
+            end = start + size + (1 if i < extra else 0)
+            subset = outcomes[start:end]
+            answer: Dict[str, Any] = {
+                "answer_text": f"Option {i + 1} ({tag})",
+                "potential_outcomes": subset,
+            }
+            if levels > 1:
+                answer["follow_up"] = (
+                    self._question(subset, levels - 1, f"{tag}.{i + 1}") if len(subset) > 1 else None
+                )
+            answers.append(answer)
+            start = end
+        return {"question": f"Which of {len(outcomes)} outcomes applies? ({tag})", "answers": answers}
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "replayed": self.replayed, "throttled": self.throttled}
+
+
+class _Completions:
+    def __init__(self, backend: _FakeBackend):
+        self._backend = backend
+
+    def parse(self, model: str, messages: List[Dict[str, str]], response_format: type[BaseModel], **kwargs: Any) -> Any:
+        self._backend.begin()
+        try:
+            completion, delay = self._backend.respond(messages, response_format)
+            if delay > 0:
+                time.sleep(delay)
+            return completion
+        finally:
+            self._backend.end()
+
+
+class _AsyncCompletions(_Completions):
+    async def parse(self, model: str, messages: List[Dict[str, str]], response_format: type[BaseModel], **kwargs: Any) -> Any:
+        self._backend.begin()
+        try:
+            completion, delay = self._backend.respond(messages, response_format)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return completion
+        finally:
+            self._backend.end()
+
+    def stream(self, model: str, messages: List[Dict[str, str]], response_format: type[BaseModel], **kwargs: Any) -> Any:
+        return _AsyncStream(self._backend, messages, response_format)
+
+
+class _AsyncStream:
+    """
+    Async context manager mimicking the SDK's structured-output stream: the
+    response JSON arrives in STREAM_CHUNKS "content.delta" events spread over
+    the call's latency.
+    """
+
+    STREAM_CHUNKS = 8
+
+    def __init__(self, backend: _FakeBackend, messages: List[Dict[str, str]], response_format: type[BaseModel]):
+        self._backend = backend
+        self._messages = messages
+        self._response_format = response_format
+        self._completion: Any = None
+        self._delay = 0.0
+        self._sent = 0
+
+    async def __aenter__(self) -> "_AsyncStream":
+        self._backend.begin()
+        self._completion, self._delay = self._backend.respond(self._messages, self._response_format)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._backend.end()
+
+    def __aiter__(self) -> Any:
+        return self._events()
+
+    async def _events(self) -> Any:
+        text = self._completion.choices[0].message.parsed.model_dump_json()
+        step = -(-len(text) // self.STREAM_CHUNKS)
+        while self._sent < len(text):
+            if self._delay > 0:
+                await asyncio.sleep(self._delay / self.STREAM_CHUNKS)
+            delta = text[self._sent:self._sent + step]
+            self._sent += len(delta)
+            yield SimpleNamespace(type="content.delta", delta=delta, snapshot=text[:self._sent])
+
+    async def get_final_completion(self) -> Any:
+        async for _ in self._events():
+            pass
+        return self._completion
+
+
+class FakeOpenAI:
+    """Drop-in for OpenAI in DecisionTreeGenerator. See _FakeBackend for the arguments."""
+
+    _completions_class = _Completions
+
+    def __init__(self, **kwargs: Any):
+        self.backend = _FakeBackend(**kwargs)
+        completions = self._completions_class(self.backend)
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    def stats(self) -> Dict[str, int]:
+        return self.backend.stats()
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncFakeOpenAI(FakeOpenAI):
+    """Drop-in for AsyncOpenAI in AsyncDecisionTreeGenerator."""
+
+    _completions_class = _AsyncCompletions
+
+    async def close(self) -> None:
+        pass
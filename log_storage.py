@@ -0,0 +1,206 @@
+"""
+Storage of tree snapshots and their LLM call logs.
+
+Snapshots ending in .json are written as indented JSON with every prompt
+rendered, as before. Snapshots ending in .json.gz are gzip-compressed compact
+JSON in which each prompt is stored as the name of its template in prompts.py
+plus the values it was formatted with; the template texts are stored once per
+file, so the file renders the exact original prompts even after prompts.py
+changes. Prompts that match no template are kept as rendered text.
+
+Usage:
+    python log_storage.py compress logs/*.json [--keep]
+    python log_storage.py prompts logs/<tree>.json.gz [--index 3]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import re
+import string
+from typing import Any, Dict, List, Optional, Tuple
+
+import prompts
+
+COMPRESSED_EXTENSION = ".json.gz"
+SNAPSHOT_EXTENSIONS = (".json", COMPRESSED_EXTENSION)
+# Snapshot persistence rewrites the file after every change, so favour speed over ratio
+COMPRESS_LEVEL = 6
+PROMPT_KEYS = ("system_prompt", "user_prompt")
+
+
+def is_compressed(path: str) -> bool:
+    return path.endswith(COMPRESSED_EXTENSION)
+
+
+def snapshot_base(path: str) -> str:
+    """path without its snapshot extension, for deriving journal and compiled file names."""
+    for extension in (COMPRESSED_EXTENSION, ".json"):
+        if path.endswith(extension):
+            return path[:-len(extension)]
+    return path
+
+
+class PromptTemplate:
+    """A str.format template that can also recover the values a rendered prompt was formatted with."""
+
+    def __init__(self, name: str, text: str):
+        self.name = name
+        self.text = text
+        pattern = []
+        seen = set()
+        for literal, field, spec, conversion in string.Formatter().parse(text):
+            pattern.append(re.escape(literal))
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"Template {name} has a field that cannot be matched: {field}")
+            # A repeated field must have the same value everywhere
+            pattern.append(f"(?P={field})" if field in seen else f"(?P<{field}>.*?)")
+            seen.add(field)
+        self.regex = re.compile("".join(pattern), re.S)
+
+    def match(self, prompt: str) -> Optional[Dict[str, str]]:
+        """The values that render this template to exactly prompt, or None."""
+        match = self.regex.fullmatch(prompt)
+        if match is None:
+            return None
+        params = match.groupdict()
+        return params if self.text.format(**params) == prompt else None
+
+
+def _load_templates() -> List[PromptTemplate]:
+    templates = []
+    for name, text in vars(prompts).items():
+        if not name.endswith("_PROMPT") or not isinstance(text, str):
+            continue
+        try:
+            templates.append(PromptTemplate(name, text))
+        except ValueError:
+            continue
+    # Longest first, so a prompt is matched by its most specific template
+    return sorted(templates, key=lambda template: len(template.text), reverse=True)
+
+
+TEMPLATES = _load_templates()
+
+
+def encode_prompt(prompt: str, used: Dict[str, str]) -> Any:
+    """{"template": name, "params": {...}} for prompt, adding the template to used; prompt if none matches."""
+    for template in TEMPLATES:
+        params = template.match(prompt)
+        if params is not None:
+            used[template.name] = template.text
+            return {"template": template.name, "params": params}
+    return prompt
+
+
+def render_prompt(value: Any, templates: Dict[str, str]) -> str:
+    """Re-render a prompt stored by encode_prompt() with the templates of its file."""
+    if isinstance(value, str):
+        return value
+    return templates[value["template"]].format(**value["params"])
+
+
+def encode_logs(logs: List[Dict[str, Any]]) -> Tuple[Dict[str, str], List[Dict[str, Any]]]:
+    """Replace rendered prompts by template references. Returns the templates used and the new logs."""
+    used: Dict[str, str] = {}
+    encoded = []
+    for log in logs:
+        log = dict(log)
+        for key in PROMPT_KEYS:
+            if isinstance(log.get(key), str):
+                log[key] = encode_prompt(log[key], used)
+        encoded.append(log)
+    return used, encoded
+
+
+def decode_logs(logs: List[Dict[str, Any]], templates: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Inverse of encode_logs(): logs with every prompt rendered again."""
+    for log in logs:
+        for key in PROMPT_KEYS:
+            if key in log:
+                log[key] = render_prompt(log[key], templates)
+    return logs
+
+
+def dump_snapshot(path: str, data: Dict[str, Any]) -> None:
+    """Write a snapshot ({"meta", "tree", "logs"}) in the format its extension selects."""
+    if not is_compressed(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        return
+    templates, logs = encode_logs(data.get("logs", []))
+    data = {**data, "templates": templates, "logs": logs}
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with gzip.open(path, 'wb', compresslevel=COMPRESS_LEVEL) as f:
+        f.write(payload)
+
+
+def load_snapshot(path: str) -> Dict[str, Any]:
+    """Read a snapshot in either format, with all prompts rendered."""
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if compressed else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    templates = data.pop("templates", None)
+    if templates is not None:
+        decode_logs(data.get("logs", []), templates)
+    return data
+
+
+def compress(path: str, keep: bool = False) -> Optional[str]:
+    """Convert a .json snapshot to .json.gz, checking that every prompt renders back. Returns the new path."""
+    target = snapshot_base(path) + COMPRESSED_EXTENSION
+    data = load_snapshot(path)
+    dump_snapshot(target, data)
+    if load_snapshot(target) != data:
+        os.remove(target)
+        print(f"Skipping {path}: compressed copy does not read back identically")
+        return None
+    if not keep:
+        os.remove(path)
+    return target
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    compress_parser = commands.add_parser("compress", help="Convert .json snapshots to .json.gz")
+    compress_parser.add_argument("paths", nargs="+")
+    compress_parser.add_argument("--keep", action="store_true", help="Keep the original files")
+    prompts_parser = commands.add_parser("prompts", help="Print the rendered prompts of a snapshot")
+    prompts_parser.add_argument("path")
+    prompts_parser.add_argument("--index", type=int, help="Only this log entry")
+    args = parser.parse_args()
+
+    if args.command == "compress":
+        before = after = 0
+        for path in args.paths:
+            if is_compressed(path):
+                continue
+            # A journal next to the snapshot means the tree is still being written
+            if os.path.exists(snapshot_base(path) + ".journal.jsonl"):
+                print(f"Skipping {path}: tree has a journal")
+                continue
+            size = os.path.getsize(path)
+            target = compress(path, keep=args.keep)
+            if target is not None:
+                before += size
+                after += os.path.getsize(target)
+                print(f"{path} -> {target}: {size} -> {os.path.getsize(target)} bytes")
+        if before:
+            print(f"Total: {before} -> {after} bytes ({after / before:.1%})")
+    else:
+        logs = load_snapshot(args.path).get("logs", [])
+        entries = [(args.index, logs[args.index])] if args.index is not None else list(enumerate(logs))
+        for index, log in entries:
+            print(f"=== [{index}] {log.get('type')} {log.get('timestamp', '')}")
+            for key in PROMPT_KEYS:
+                print(f"--- {key}\n{log.get(key, '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,9 +4,18 @@ LLM Decision Tree Generator - Proof of Concept
 Pre-generates a complete decision tree using LLM calls.
 """
 
-from openai import OpenAI
-from config import BASE_URL, API_KEY, LLM_MODEL
+from config import (
+    LLM_MODEL, MAX_CONCURRENCY, EXPANSION_PRIORITY, EXPANSION_LEVELS, REUSE_SUBTREES, PROMPT_ENCODING, PERSISTENCE_MODE,
+    SPECULATION_ENABLED, SPECULATION_FANOUT, SPECULATION_DEPTH, SPECULATION_TOKEN_BUDGET
+)
 from tree import DecisionTreeGenerator
+from speculation import SpeculativeExpander
+from scheduler import GenerationBudget
+from cache import create_default_cache
+from catalog import create_default_catalog
+from prompt_encoding import prompt_savings
+from clients import create_openai_client
+import metrics
 
 def main():
     # Example: Medical diagnosis for chest pain
@@ -18,10 +27,17 @@ def main():
     print("-" * 50)
 
     # Initialize OpenAI client
-    client = OpenAI(base_url=BASE_URL, api_key=API_KEY)
+    client = create_openai_client()
+
+    # Trees saved by earlier runs; a match is served instead of generating again
+    catalog = create_default_catalog()
     
     # Initialize Generator
-    generator = DecisionTreeGenerator(client, LLM_MODEL)
+    generator = DecisionTreeGenerator(
+        client, LLM_MODEL, max_workers=MAX_CONCURRENCY, persistence=PERSISTENCE_MODE,
+        cache=create_default_cache(), priority=EXPANSION_PRIORITY, expansion_levels=EXPANSION_LEVELS,
+        reuse_subtrees=REUSE_SUBTREES, catalog=catalog, prompt_encoding=PROMPT_ENCODING
+    )
 
     # Ask user for mode
     print("Select generation mode:")
@@ -34,10 +50,24 @@ def main():
             break
         print("Invalid choice. Please enter 1 or 2.")
 
+    stored_root = None
+    if catalog is not None:
+        # Recursive mode needs a finished tree; interactive mode can continue a partial one
+        match = catalog.lookup(role, query, complete_only=(mode == "1"))
+        if match is not None:
+            stored_root = catalog.load(match)
+        if stored_root is not None:
+            print(f"\nServing stored tree from {match['path']} (match score {match['score']:.2f})")
+            # Expansions continue the stored tree, so they use its role and query
+            role, query = match["role"], match["query"]
+
     if mode == "1":
         # Recursive Mode
-        print("\nStarting Recursive Generation...")
-        root = generator.generate(role, query, recursive=True)
+        if stored_root is not None:
+            root = stored_root
+        else:
+            print("\nStarting Recursive Generation...")
+            root = generator.generate(role, query, recursive=True, budget=GenerationBudget.from_config())
         print("-" * 50)
         print("Generated Decision Tree:")
         print("=" * 50)
@@ -45,9 +75,21 @@ def main():
         
     else:
         # Interactive Mode
-        print("\nStarting Interactive Generation...")
-        root = generator.generate(role, query, recursive=False)
+        if stored_root is not None:
+            root = stored_root
+        else:
+            print("\nStarting Interactive Generation...")
+            root = generator.generate(role, query, recursive=False)
         current_node = root
+
+        speculator = None
+        if SPECULATION_ENABLED:
+            # Prefetch likely next questions while the user reads the current one
+            speculator = SpeculativeExpander(
+                generator, role, query, max_workers=MAX_CONCURRENCY, fan_out=SPECULATION_FANOUT,
+                depth=SPECULATION_DEPTH, token_budget=SPECULATION_TOKEN_BUDGET
+            )
+            speculator.speculate(root)
         
         while True:
             print("\n" + "=" * 50)
@@ -79,7 +121,10 @@ def main():
                 break
                 
             print(f"\nGenerating next question for answer: {selected_answer.answer_text}...")
-            next_node = generator.expand_node(role, query, selected_answer)
+            if speculator:
+                next_node = speculator.expand(selected_answer)
+            else:
+                next_node = generator.expand_node(role, query, selected_answer)
             
             if next_node:
                 current_node = next_node
@@ -87,10 +132,33 @@ def main():
                 print("No further questions generated.")
                 break
 
+        if speculator:
+            speculator.close()
+            stats = speculator.stats()
+            print(f"\nSpeculation: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                  f"{stats['tokens_wasted']} of {stats['tokens_spent']} speculative tokens wasted")
+
+        # Write the final snapshot for the partial tree
+        if generator.persistence == "journal":
+            generator.compact(root, role, query)
+
         print("\n" + "-" * 50)
         print("Final Generated Tree (Partial):")
         print("=" * 50)
         print(root)
 
+    if generator.cache is not None:
+        stats = generator.cache.stats()
+        print(f"\nCache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+    if generator.prompt_encoding == "compact":
+        savings = prompt_savings(root)
+        print(f"Compact prompts: {savings['prompt_tokens']} prompt tokens sent over {savings['calls']} calls, "
+              f"~{savings['prompt_tokens_saved']} saved")
+    if generator.reuse_subtrees:
+        print(f"Subtree reuse: {generator.reused_questions} LLM calls saved")
+
+    print("\nMetrics:")
+    print(metrics.summary(LLM_MODEL))
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,241 @@
+"""
+Process-wide metrics: counters and histograms with labels, rendered in the
+Prometheus text exposition format or as a short text summary.
+"""
+
+import bisect
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Seconds; covers cache-speed calls up to slow multi-level completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def _matches(self, key: Tuple[str, ...], labels: Dict[str, str]) -> bool:
+        return all(key[self.labels.index(name)] == str(value) for name, value in labels.items())
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter, one series per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Sum over every series matching the given labels."""
+        with self._lock:
+            items = list(self._values.items())
+        return sum(v for key, v in items if self._matches(key, labels))
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_number(v)}" for key, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram with sum and count, one series per label combination."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per series: [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels: str) -> Dict[str, float]:
+        """Count, sum, mean and bucket-estimated p50/p99 over every series matching the labels."""
+        counts = [0] * (len(self.buckets) + 1)
+        total, count = 0.0, 0
+        with self._lock:
+            for key, series in self._series.items():
+                if self._matches(key, labels):
+                    counts = [a + b for a, b in zip(counts, series[0])]
+                    total += series[1]
+                    count += series[2]
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "p50": self._quantile(counts, count, 0.50),
+            "p99": self._quantile(counts, count, 0.99),
+        }
+
+    def _quantile(self, counts: List[int], count: int, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile."""
+        if not count:
+            return 0.0
+        rank, seen = q * count, 0
+        for bound, bucket in zip(self.buckets + (math.inf,), counts):
+            seen += bucket
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series[0]), series[1], series[2]) for key, series in self._series.items())
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket
+                le = f'le="{_format_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds named metrics and renders them together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(
+        self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def _register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+LLM_REQUESTS = registry.counter(
+    "llm_requests_total", "Question requests, including cache hits.", ("model", "role", "type")
+)
+LLM_CACHE_HITS = registry.counter(
+    "llm_cache_hits_total", "Question requests served from the response cache.", ("model", "role")
+)
+LLM_LATENCY = registry.histogram(
+    "llm_request_duration_seconds", "Latency of LLM calls (cache hits excluded).", ("model", "role", "type")
+)
+LLM_PROMPT_TOKENS = registry.counter(
+    "llm_prompt_tokens_total", "Prompt tokens reported by the provider.", ("model", "role")
+)
+LLM_COMPLETION_TOKENS = registry.counter(
+    "llm_completion_tokens_total", "Completion tokens reported by the provider.", ("model", "role")
+)
+LLM_PROMPT_TOKENS_SAVED = registry.counter(
+    "llm_prompt_tokens_saved_total", "Estimated prompt tokens saved by compact prompt encoding.", ("model", "role")
+)
+LLM_RETRIES = registry.counter(
+    "llm_retries_total", "LLM calls retried after a transient error.", ("model",)
+)
+QUEUE_WAIT = registry.histogram(
+    "generation_queue_wait_seconds", "Time generation jobs wait for a free worker."
+)
+SAVE_DURATION = registry.histogram(
+    "tree_save_duration_seconds", "Time spent persisting trees.", ("mode",)
+)
+
+
+def record_llm_call(model: str, role: str, log_entry: Dict[str, Any]) -> None:
+    """Record one question request from its log entry."""
+    LLM_REQUESTS.inc(model=model, role=role, type=log_entry["type"])
+    if log_entry.get("cached"):
+        LLM_CACHE_HITS.inc(model=model, role=role)
+        return
+    LLM_LATENCY.observe(log_entry["duration_seconds"], model=model, role=role, type=log_entry["type"])
+    usage = log_entry.get("usage") or {}
+    LLM_PROMPT_TOKENS.inc(usage.get("prompt_tokens", 0), model=model, role=role)
+    LLM_COMPLETION_TOKENS.inc(usage.get("completion_tokens", 0), model=model, role=role)
+    if log_entry.get("prompt_tokens_saved"):
+        LLM_PROMPT_TOKENS_SAVED.inc(log_entry["prompt_tokens_saved"], model=model, role=role)
+
+
+def summary(model: Optional[str] = None) -> str:
+    """Human-readable totals, optionally for one model."""
+    labels = {"model": model} if model else {}
+    latency = LLM_LATENCY.snapshot(**labels)
+    saves = SAVE_DURATION.snapshot()
+    requests = LLM_REQUESTS.value(**labels)
+    hits = LLM_CACHE_HITS.value(**labels)
+    lines = [
+        f"LLM requests:  {requests:.0f} ({hits:.0f} cache hits, {LLM_RETRIES.value(**labels):.0f} retries)",
+        f"LLM latency:   mean {latency['mean']:.2f}s, p50 <= {latency['p50']}s, p99 <= {latency['p99']}s, "
+        f"total {latency['sum']:.1f}s",
+        f"Tokens:        {LLM_PROMPT_TOKENS.value(**labels):.0f} prompt, "
+        f"{LLM_COMPLETION_TOKENS.value(**labels):.0f} completion",
+        f"Saving:        {saves['count']} writes, total {saves['sum']:.2f}s",
+    ]
+    saved = LLM_PROMPT_TOKENS_SAVED.value(**labels)
+    if saved:
+        lines.append(f"Compact prompts: ~{saved:.0f} prompt tokens saved")
+    queue = QUEUE_WAIT.snapshot()
+    if queue["count"]:
+        lines.append(f"Queue wait:    mean {queue['mean']:.2f}s over {queue['count']} jobs")
+    return "\n".join(lines)
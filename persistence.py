@@ -0,0 +1,100 @@
+"""Append-only journal storage for incrementally persisting decision trees."""
+
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class TreeJournal:
+    """
+    Append-only JSON Lines journal for a single tree.
+    Each expansion is written as one compact record, so the cost of persisting
+    a change does not depend on the size of the tree.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Append a single record to the journal."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over journal records, skipping a torn trailing line."""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write can leave a partial last line
+                    print(f"Skipping corrupt journal line in {self.path}")
+
+    def remove(self) -> None:
+        if self.exists():
+            os.remove(self.path)
+
+
+class BackgroundWriter:
+    """
+    Runs persistence jobs one at a time, in submission order, on a background
+    thread, so code on the event loop never waits on disk.
+
+    Jobs that create or remove a journal say so when submitted; journal_exists()
+    answers whether a journal will exist once the queued jobs have run, so a
+    caller can decide how to start its next record without waiting for them.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tree-writer")
+        self._lock = threading.Lock()
+        # Journal path -> [exists after the queued jobs, number of queued jobs touching it]
+        self._journals: Dict[str, List[Any]] = {}
+
+    def submit(
+        self, job: Callable[[], Any], journal: Optional[str] = None, journal_exists: bool = True
+    ) -> Future:
+        if journal is not None:
+            with self._lock:
+                state = self._journals.setdefault(journal, [journal_exists, 0])
+                state[0] = journal_exists
+                state[1] += 1
+        return self._executor.submit(self._run, job, journal)
+
+    def _run(self, job: Callable[[], Any], journal: Optional[str]) -> Any:
+        try:
+            return job()
+        except Exception as e:
+            print(f"Error in background tree write: {e}")
+        finally:
+            if journal is not None:
+                with self._lock:
+                    state = self._journals[journal]
+                    state[1] -= 1
+                    if state[1] == 0:
+                        del self._journals[journal]
+
+    def journal_exists(self, path: str) -> bool:
+        with self._lock:
+            state = self._journals.get(path)
+        return state[0] if state is not None else os.path.exists(path)
+
+    def flush(self) -> Future:
+        """A future that completes once every job submitted so far has run."""
+        return self._executor.submit(lambda: None)
+
+
+# One writer per process: jobs for the same tree stay ordered whichever generator queued them
+tree_writer = BackgroundWriter()
@@ -0,0 +1,83 @@
+"""
+Compact prompt encoding: shorter decision paths, outcomes referenced by short
+ids, and role-independent system prompts so every call shares the same prefix.
+
+Outcome ids are derived from the outcome text ("O" plus a few hex digits of
+its hash), so the same outcome has the same id in every call and tree. The
+model answers with ids, which decode_outcomes() maps back to the texts.
+"""
+
+import hashlib
+import re
+from typing import Any, Dict, List
+
+from pydantic import BaseModel
+
+# Rough tokens per character for English prompts; only used for savings estimates
+CHARS_PER_TOKEN = 4
+
+_HISTORY_LINE = re.compile(r"^\t*(Question|Answer): ", re.M)
+_CODE = re.compile(r"^\s*(O[0-9a-fA-F]+)\b")
+
+
+def estimate_tokens(*texts: str) -> int:
+    return sum(len(text) for text in texts) // CHARS_PER_TOKEN
+
+
+def compact_history(history: str) -> str:
+    """Drop the indentation of get_history_str() output and shorten its labels to Q:/A:."""
+    return _HISTORY_LINE.sub(lambda match: f"{match.group(1)[0]}: ", history)
+
+
+def outcome_codes(outcomes: List[str]) -> Dict[str, str]:
+    """Map each outcome to its id, lengthening the ids if two outcomes of this call collide."""
+    digests = [hashlib.sha1(outcome.encode("utf-8")).hexdigest() for outcome in outcomes]
+    length = 3
+    while len({digest[:length] for digest in set(digests)}) < len(set(digests)):
+        length += 1
+    return {outcome: f"O{digest[:length]}" for outcome, digest in zip(outcomes, digests)}
+
+
+def encode_outcomes(outcomes: List[str]) -> str:
+    codes = outcome_codes(outcomes)
+    return "\n".join(f"- {codes[outcome]}: {outcome}" for outcome in outcomes)
+
+
+def decode_outcome_list(values: List[str], outcomes: List[str]) -> List[str]:
+    """
+    Map ids (or the outcome texts themselves) to outcome texts, in order and
+    without duplicates. Entries that match no outcome of this call are dropped.
+    """
+    by_code = {code.upper(): outcome for outcome, code in outcome_codes(outcomes).items()}
+    known = set(outcomes)
+    decoded: Dict[str, None] = {}
+    for value in values:
+        if value not in known:
+            match = _CODE.match(value)
+            value = by_code.get(match.group(1).upper()) if match else None
+        if value is not None:
+            decoded[value] = None
+    return list(decoded)
+
+
+def decode_outcomes(data: BaseModel, outcomes: List[str]) -> BaseModel:
+    """Decode every potential_outcomes list of a (nested) response with decode_outcome_list()."""
+    raw = data.model_dump()
+    stack = [raw]
+    while stack:
+        question = stack.pop()
+        for answer in question.get("answers", []):
+            answer["potential_outcomes"] = decode_outcome_list(answer["potential_outcomes"], outcomes)
+            if answer.get("follow_up"):
+                stack.append(answer["follow_up"])
+    return type(data).model_validate(raw)
+
+
+def prompt_savings(root: Any) -> Dict[str, int]:
+    """Prompt tokens sent for a tree and the estimated tokens compact encoding saved, from its logs."""
+    calls = [log for log in root.logs if not log.get("cached")]
+    return {
+        "calls": len(calls),
+        "prompt_tokens": sum((log.get("usage") or {}).get("prompt_tokens", 0) for log in calls),
+        "prompt_tokens_saved": sum(log.get("prompt_tokens_saved", 0) for log in calls),
+    }
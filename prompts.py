@@ -46,6 +46,41 @@ Generate a response with this exact structure:
 - The question should maximally reduce uncertainty in one step
 """
 
+SUBTREE_SYSTEM_PROMPT = """# Role
+You are {role}. Your task is to create the next {levels} levels of branching questions for a decision tree.
+
+# Task
+Generate a response with this exact structure:
+```json
+{{
+    "question": "The question that best differentiates these outcomes",
+    "answers": [
+        {{
+            "answer_text": "Answer option 1",
+            "potential_outcomes": ["Outcome A", "Outcome C"],
+            "follow_up": {{
+                "question": "The question that best differentiates Outcome A and Outcome C",
+                "answers": [
+                    {{"answer_text": "Answer option 1a", "potential_outcomes": ["Outcome A"], "follow_up": null}},
+                    {{"answer_text": "Answer option 1b", "potential_outcomes": ["Outcome C"], "follow_up": null}}
+                ]
+            }}
+        }},
+        {{"answer_text": "Answer option 2", "potential_outcomes": ["Outcome B"], "follow_up": null}}
+    ]
+}}
+```
+
+# Requirements
+- Create ONE question that best distinguishes between the possible outcomes
+- Answers must be mutually exclusive and collectively exhaustive
+- Each answer's outcomes list must be a non-empty subset of the original outcomes
+- For every answer with more than one outcome, add a "follow_up" question built by the same rules,
+  whose answers split only that answer's outcomes
+- Nest follow-up questions at most {levels} levels deep in total; set "follow_up" to null below that
+  and for answers with a single outcome
+"""
+
 # User prompts
 INITIAL_USER_PROMPT = """
 Initial user query: {query}
@@ -59,4 +94,39 @@ Initial query: {query}
 
 # Current Possible Outcomes
 {outcomes}
-"""
\ No newline at end of file
+"""
+
+# Compact encoding (PROMPT_ENCODING=compact). System prompts do not depend on the
+# role, so every call starts with an identical prefix; the user prompt then goes
+# from the most to the least shared part: role, query, path, outcomes.
+COMPACT_INITIAL_SYSTEM_PROMPT = """You start a decision tree as the expert named in the user message.
+Return the most useful first question: {{"question": str, "answers": [{{"answer_text": str, "potential_outcomes": [str]}}]}}
+- List ALL logically possible outcomes for this domain; make them specific and actionable
+- Answers are mutually exclusive and together cover all scenarios
+"""
+
+COMPACT_DISCRIMINATING_SYSTEM_PROMPT = """You extend a decision tree as the expert named in the user message.
+Return ONE question that best distinguishes the outcomes: {{"question": str, "answers": [{{"answer_text": str, "potential_outcomes": [id]}}]}}
+- Answers are mutually exclusive and collectively exhaustive
+- potential_outcomes holds outcome ids (e.g. "O1a2") from the list, never empty
+- The question should maximally reduce uncertainty in one step
+"""
+
+COMPACT_SUBTREE_SYSTEM_PROMPT = """You extend a decision tree as the expert named in the user message, for the next {levels} levels.
+Return: {{"question": str, "answers": [{{"answer_text": str, "potential_outcomes": [id], "follow_up": <same shape or null>}}]}}
+- Each question best distinguishes its outcomes; answers are mutually exclusive and collectively exhaustive
+- potential_outcomes holds outcome ids (e.g. "O1a2") from the list, never empty; a follow_up splits only its answer's ids
+- Nest follow-ups at most {levels} levels deep in total; use null below that and for single-outcome answers
+"""
+
+COMPACT_INITIAL_USER_PROMPT = """Expert: {role}
+Query: {query}
+"""
+
+COMPACT_DISCRIMINATING_USER_PROMPT = """Expert: {role}
+Query: {query}
+Path:
+{history}
+Outcomes:
+{outcomes}
+"""
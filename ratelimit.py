@@ -0,0 +1,237 @@
+"""
+Retry with backoff and adaptive (AIMD) concurrency limiting for LLM calls.
+
+Every generator in the process shares one AdaptiveLimiter by default, so the
+total number of in-flight requests tracks what the provider accepts: the
+limit grows by about one per window of successful calls and is cut by a
+factor whenever a call is throttled.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import openai
+
+from config import (
+    RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX,
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+)
+from metrics import LLM_RETRIES
+
+T = TypeVar("T")
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+# Errors that mean the provider wants less traffic
+THROTTLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit usable from threads and event loops at once.
+
+    acquire() returns a token (the time the call was admitted) that is passed
+    back to release(). A throttle only shrinks the limit if the call was
+    admitted after the previous shrink, so one burst of 429s counts once.
+    """
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.backoff = backoff
+        self.in_flight = 0
+        self.throttles = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters: Deque[asyncio.Future] = deque()
+
+    def _has_room(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def acquire(self) -> float:
+        with self._cond:
+            while not self._has_room():
+                self._cond.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def acquire_async(self) -> float:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._has_room():
+                    self.in_flight += 1
+                    return time.monotonic()
+                waiter = loop.create_future()
+                self._async_waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+                    else:
+                        # Already woken: pass the wakeup on instead of losing it
+                        self._wake()
+                raise
+
+    def release(self, token: float, outcome: str = "success") -> None:
+        """
+        Return a slot. outcome is "success" (grow the limit), "throttled"
+        (shrink it) or "error" (leave it unchanged).
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif outcome == "throttled":
+                self.throttles += 1
+                if token >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+            self._wake()
+
+    def _wake(self) -> None:
+        """Wake waiters while there is room; called with the lock held."""
+        self._cond.notify_all()
+        room = int(self.limit) - self.in_flight
+        while room > 0 and self._async_waiters:
+            waiter = self._async_waiters.popleft()
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(_resolve, waiter)
+                room -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "throttles": self.throttles,
+            }
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+_shared_limiter: Optional[AdaptiveLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def shared_limiter() -> AdaptiveLimiter:
+    """The process-wide limiter, created from config on first use."""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = AdaptiveLimiter(RATE_LIMIT_INITIAL, RATE_LIMIT_MIN, RATE_LIMIT_MAX)
+        return _shared_limiter
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the provider asked us to wait, from Retry-After(-Ms) headers, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, but never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    server_delay = retry_after(error)
+    if server_delay is not None:
+        delay = max(delay, min(server_delay, RETRY_MAX_DELAY))
+    return delay
+
+
+def _release(limiter: Optional[AdaptiveLimiter], token: float, error: Optional[BaseException]) -> None:
+    if limiter is None:
+        return
+    if error is None:
+        limiter.release(token, "success")
+    elif isinstance(error, THROTTLE_ERRORS):
+        limiter.release(token, "throttled")
+    else:
+        limiter.release(token, "error")
+
+
+def _retry_delay(attempt: int, error: Exception, model: str) -> float:
+    delay = backoff_delay(attempt, error)
+    print(f"LLM call failed ({type(error).__name__}), retrying in {delay:.1f}s")
+    LLM_RETRIES.inc(model=model)
+    return delay
+
+
+def call_with_retry(request: Callable[[], T], model: str, limiter: Optional[AdaptiveLimiter] = None) -> T:
+    """Run request() under the limiter, retrying transient errors up to RETRY_MAX_ATTEMPTS times."""
+    attempt = 0
+    while True:
+        token = limiter.acquire() if limiter else 0.0
+        try:
+            result = request()
+        except RETRYABLE_ERRORS as e:
+            _release(limiter, token, e)
+            if attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                raise
+            time.sleep(_retry_delay(attempt, e, model))
+            attempt += 1
+            continue
+        except BaseException as e:
+            _release(limiter, token, e)
+            raise
+        _release(limiter, token, None)
+        return result
+
+
+async def call_with_retry_async(
+    request: Callable[[], Awaitable[T]], model: str, limiter: Optional[AdaptiveLimiter] = None
+) -> T:
+    """Async counterpart of call_with_retry; request must return a new awaitable on each call."""
+    attempt = 0
+    while True:
+        token = await limiter.acquire_async() if limiter else 0.0
+        try:
+            result = await request()
+        except RETRYABLE_ERRORS as e:
+            _release(limiter, token, e)
+            if attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                raise
+            await asyncio.sleep(_retry_delay(attempt, e, model))
+            attempt += 1
+            continue
+        except BaseException as e:
+            _release(limiter, token, e)
+            raise
+        _release(limiter, token, None)
+        return result
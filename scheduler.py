@@ -0,0 +1,144 @@
+"""Budgeted, priority-ordered scheduling of answer expansions for recursive generation."""
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import MAX_DEPTH, BUDGET_MAX_TOKENS, BUDGET_MAX_REQUESTS, BUDGET_MAX_SECONDS
+
+
+class GenerationBudget:
+    """
+    Limits for one recursive run. None means unlimited.
+    Answers at depth >= max_depth are never expanded.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_requests: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        max_depth: int = MAX_DEPTH,
+    ):
+        self.max_tokens = max_tokens
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_config(cls) -> "GenerationBudget":
+        """Budget from config, where 0 means unlimited."""
+        return cls(
+            max_tokens=BUDGET_MAX_TOKENS or None,
+            max_requests=BUDGET_MAX_REQUESTS or None,
+            max_seconds=BUDGET_MAX_SECONDS or None,
+        )
+
+
+# Sort keys for the frontier; smaller keys are expanded first
+PRIORITIES = {
+    "outcomes": lambda answer: -len(answer.potential_outcomes),  # Most uncertain branch first
+    "shallow": lambda answer: answer.depth,  # Breadth-first
+    "deep": lambda answer: -answer.depth,  # Depth-first
+}
+
+
+class ExpansionScheduler:
+    """
+    Priority queue of answer nodes waiting to be expanded, plus budget accounting.
+
+    The generator pushes answers, asks next() for the one to expand, and reports
+    each finished expansion with charge(). Token limits are checked before each
+    launch, so concurrent runs can overshoot by the calls already in flight.
+    When the budget runs out, mark_frontier() flags the remaining answers (and
+    those whose expansion failed) so a later run can resume from them. Answers
+    at the depth limit are final and only counted.
+    """
+
+    def __init__(self, budget: Optional[GenerationBudget] = None, priority: str = "outcomes"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.budget = budget or GenerationBudget()
+        self._key = PRIORITIES[priority]
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()  # Tie-breaker keeps FIFO order among equal keys
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self.depth_limited = 0  # Answers not expanded because they are at the depth limit
+        self._failed: List[Any] = []  # Answers whose expansion failed after retries
+        self.requests = 0
+        self.tokens = 0
+        self.questions = 0  # Questions attached; above requests when expansions are multi-level
+        self.reused_questions = 0  # Questions copied from matching branches without an LLM call
+        self.stop_reason: Optional[str] = None
+
+    def push(self, answer: Any) -> None:
+        if answer.is_leaf or answer.child is not None:
+            return
+        with self._lock:
+            if answer.depth >= self.budget.max_depth:
+                self.depth_limited += 1
+                return
+            heapq.heappush(self._heap, (self._key(answer), next(self._counter), answer))
+
+    def next(self) -> Optional[Any]:
+        """Pop the next answer to expand, or None if the queue is empty or the budget is spent."""
+        with self._lock:
+            if not self._heap or self._exhausted():
+                return None
+            self.requests += 1
+            return heapq.heappop(self._heap)[2]
+
+    def charge(self, log_entry: Optional[Dict[str, Any]], questions: int = 1) -> None:
+        """Record a finished expansion. log_entry is None when it was served without an LLM call."""
+        with self._lock:
+            self.questions += questions
+            if log_entry is None:
+                self.requests -= 1
+                self.reused_questions += questions
+                return
+            usage = log_entry.get("usage") or {}
+            self.tokens += usage.get("total_tokens", 0)
+
+    def defer(self, answer: Any) -> None:
+        """Hold back an answer whose expansion failed; it is marked as frontier at the end of the run."""
+        with self._lock:
+            self._failed.append(answer)
+
+    def _exhausted(self) -> bool:
+        budget = self.budget
+        if budget.max_requests is not None and self.requests >= budget.max_requests:
+            self.stop_reason = "requests"
+        elif budget.max_tokens is not None and self.tokens >= budget.max_tokens:
+            self.stop_reason = "tokens"
+        elif budget.max_seconds is not None and time.time() - self._started_at >= budget.max_seconds:
+            self.stop_reason = "time"
+        return self.stop_reason is not None
+
+    def mark_frontier(self) -> int:
+        """
+        Flag the answers left by the budget or by failed expansions so they can
+        be resumed. Returns how many.
+        """
+        with self._lock:
+            remaining = [entry[2] for entry in self._heap] + self._failed
+            if self._failed and self.stop_reason is None:
+                self.stop_reason = "errors"
+            self._heap.clear()
+        for answer in remaining:
+            answer.frontier = True
+        return len(remaining)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "questions": self.questions,
+            "reused_questions": self.reused_questions,
+            "failed": len(self._failed),
+            "depth_limited": self.depth_limited,
+            "tokens": self.tokens,
+            "seconds": time.time() - self._started_at,
+            "stop_reason": self.stop_reason,
+        }
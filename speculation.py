@@ -0,0 +1,324 @@
+"""Speculative prefetch of follow-up questions for interactive generation."""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from tree import DecisionTreeGenerator, QuestionSchema, QuestionNode, AnswerNode, expansion_flights
+from async_tree import expansion_flights as async_expansion_flights
+
+
+class Speculation:
+    """A background expansion of an answer the user has not picked yet."""
+
+    __slots__ = ("history", "outcomes", "question_depth", "level", "result", "children", "handle", "cancelled")
+
+    def __init__(self, history: str, outcomes: List[str], question_depth: int, level: int):
+        self.history = history
+        self.outcomes = outcomes
+        self.question_depth = question_depth  # Depth the generated question will have once attached
+        self.level = level  # 1 for answers of the visible question, 2 for their grandchildren, ...
+        self.result: Optional[tuple[QuestionSchema, Dict[str, Any]]] = None
+        self.children: Dict[int, "Speculation"] = {}  # Keyed by answer index in result
+        self.handle: Any = None  # Future or Task running the expansion
+        self.cancelled = False
+
+
+class _SpeculatorBase:
+    """
+    Bookkeeping shared by the sync and async speculators.
+
+    Finished speculations are held back (not attached, logged or saved) until the
+    user picks that answer. Speculations under the siblings of a picked answer
+    are discarded, and the tokens they used are reported as wasted.
+    """
+
+    def __init__(
+        self,
+        generator: DecisionTreeGenerator,
+        role: str,
+        query: str,
+        fan_out: int = 3,
+        depth: int = 1,
+        token_budget: int = 20000,
+    ):
+        self.generator = generator
+        self.role = role
+        self.query = query
+        self.fan_out = fan_out
+        self.depth = depth
+        self.token_budget = token_budget
+        self._pending: Dict[str, Speculation] = {}  # Keyed by the id of the real AnswerNode
+        self.hits = 0
+        self.misses = 0
+        self.launched = 0
+        self.discarded = 0
+        self.tokens_spent = 0
+        self.tokens_wasted = 0
+
+    def _candidates(self, question_node: QuestionNode) -> List[AnswerNode]:
+        """Answers worth expanding ahead of time."""
+        answers = [
+            answer for answer in question_node.answers
+            if not answer.is_leaf and answer.child is None and answer.id not in self._pending
+        ]
+        return answers[:self.fan_out]
+
+    def _budget_left(self) -> bool:
+        return self.tokens_spent < self.token_budget
+
+    def _record(self, spec: Speculation, question_data: QuestionSchema, log_entry: Dict[str, Any]) -> None:
+        """Store a finished speculation and account for its tokens."""
+        usage = log_entry.get("usage") or {}
+        tokens = usage.get("total_tokens", 0)
+        self.tokens_spent += tokens
+        if spec.cancelled:
+            self.tokens_wasted += tokens
+            return
+        spec.result = (question_data, log_entry)
+
+    def _child_specs(self, spec: Speculation) -> List[Speculation]:
+        """Create speculations for the answers of a finished speculative question."""
+        if spec.result is None or spec.level >= self.depth:
+            return []
+        question_data, _ = spec.result
+        # Mirrors TreeNode.get_history_str: the question sits at question_depth, its answers one below
+        question_line = "\t" * (spec.question_depth // 2) + f"Question: {question_data.question}"
+        children = []
+        for i, answer in enumerate(question_data.answers[:self.fan_out]):
+            if len(answer.potential_outcomes) <= 1:
+                continue
+            answer_line = "\t" * ((spec.question_depth + 1) // 2) + f"Answer: {answer.answer_text}"
+            child = Speculation(
+                f"{spec.history}\n{question_line}\n{answer_line}",
+                answer.potential_outcomes,
+                spec.question_depth + 2,
+                spec.level + 1,
+            )
+            spec.children[i] = child
+            children.append(child)
+        return children
+
+    def _claim(self, answer_node: AnswerNode) -> Optional[Speculation]:
+        """Take the speculation for a picked answer and discard those of its siblings."""
+        spec = self._pending.pop(answer_node.id, None)
+        if isinstance(answer_node.parent, QuestionNode):
+            for sibling in answer_node.parent.answers:
+                if sibling is not answer_node:
+                    sibling_spec = self._pending.pop(sibling.id, None)
+                    if sibling_spec is not None:
+                        self._discard(sibling_spec)
+        return spec
+
+    def _rekey(self, spec: Speculation, question_node: QuestionNode) -> None:
+        """Move a revealed speculation's children onto the newly attached answer nodes."""
+        for i, child in spec.children.items():
+            if i < len(question_node.answers):
+                self._pending[question_node.answers[i].id] = child
+            else:
+                self._discard(child)
+
+    def _discard(self, spec: Speculation) -> None:
+        stack = [spec]
+        while stack:
+            node = stack.pop()
+            node.cancelled = True
+            self.discarded += 1
+            if node.result is not None:
+                usage = node.result[1].get("usage") or {}
+                self.tokens_wasted += usage.get("total_tokens", 0)
+            elif node.handle is not None:
+                self._cancel_handle(node.handle)
+            stack.extend(node.children.values())
+
+    def _cancel_handle(self, handle: Any) -> None:
+        handle.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "launched": self.launched,
+            "discarded": self.discarded,
+            "tokens_spent": self.tokens_spent,
+            "tokens_wasted": self.tokens_wasted,
+        }
+
+
+class SpeculativeExpander(_SpeculatorBase):
+    """
+    Interactive expansion with background prefetch, for the sync generator.
+
+    Use expand() in place of generator.expand_node(); after the root is shown,
+    call speculate(root). Each expansion then speculates on the answers of the
+    question it reveals.
+    """
+
+    def __init__(self, generator: DecisionTreeGenerator, role: str, query: str, max_workers: int = 2, **kwargs: Any):
+        super().__init__(generator, role, query, **kwargs)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+        self._lock = threading.Lock()
+
+    def speculate(self, question_node: QuestionNode) -> None:
+        """Start background expansions for the answers of a visible question."""
+        with self._lock:
+            for answer in self._candidates(question_node):
+                spec = Speculation(answer.get_history_str(), answer.potential_outcomes, answer.depth + 1, 1)
+                self._pending[answer.id] = spec
+                self._launch(spec)
+
+    def _launch(self, spec: Speculation) -> None:
+        if not self._budget_left():
+            return
+        self.launched += 1
+        spec.handle = self._pool.submit(self._run, spec)
+
+    def _run(self, spec: Speculation) -> None:
+        if spec.cancelled:
+            return
+        try:
+            question_data, log_entry = self.generator._get_discriminating_question(
+                self.role, self.query, spec.history, spec.outcomes
+            )
+        except Exception as e:
+            print(f"Speculative expansion failed: {e}")
+            return
+        with self._lock:
+            self._record(spec, question_data, log_entry)
+            for child in self._child_specs(spec):
+                self._launch(child)
+
+    def expand(self, answer_node: AnswerNode) -> Optional[QuestionNode]:
+        """Reveal the speculative result for answer_node, or expand it normally."""
+        if answer_node.child is not None:
+            return answer_node.child
+        # Shared with expand_node(), so a reveal and a direct expansion of the same answer make one call
+        return expansion_flights.do(answer_node.id, self._reveal, answer_node)
+
+    def _reveal(self, answer_node: AnswerNode) -> Optional[QuestionNode]:
+        if answer_node.child is not None:
+            return answer_node.child
+        if answer_node.is_leaf:
+            return None
+
+        with self._lock:
+            spec = self._claim(answer_node)
+        if spec is not None and spec.handle is not None:
+            spec.handle.result()  # Finished or in flight: waiting beats starting over
+
+        if answer_node.child is not None:
+            # Attached by someone else while the speculation was finishing
+            if spec is not None:
+                with self._lock:
+                    self._discard(spec)
+            return answer_node.child
+        if spec is not None and spec.result is not None:
+            generator = self.generator
+            with generator._lock:
+                question_node, event = generator._attach_question(
+                    self.role, self.query, answer_node, *spec.result
+                )
+                if generator.callback and event is not None:
+                    generator.callback(event)
+            with self._lock:
+                self.hits += 1
+                self._rekey(spec, question_node)
+        else:
+            with self._lock:
+                self.misses += 1
+            # Already inside the shared flight for this answer, so expand directly
+            question_node = self.generator._expand_once(self.role, self.query, answer_node)
+
+        if question_node:
+            self.speculate(question_node)
+        return question_node
+
+    def close(self) -> None:
+        """Discard all outstanding speculations."""
+        with self._lock:
+            for spec in self._pending.values():
+                self._discard(spec)
+            self._pending.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncSpeculativeExpander(_SpeculatorBase):
+    """SpeculativeExpander for AsyncDecisionTreeGenerator; speculations run as loop tasks."""
+
+    def __init__(self, generator: DecisionTreeGenerator, role: str, query: str, **kwargs: Any):
+        super().__init__(generator, role, query, **kwargs)
+
+    def speculate(self, question_node: QuestionNode) -> None:
+        """Start background expansions for the answers of a visible question."""
+        for answer in self._candidates(question_node):
+            spec = Speculation(answer.get_history_str(), answer.potential_outcomes, answer.depth + 1, 1)
+            self._pending[answer.id] = spec
+            self._launch(spec)
+
+    def _launch(self, spec: Speculation) -> None:
+        if not self._budget_left():
+            return
+        self.launched += 1
+        spec.handle = asyncio.get_running_loop().create_task(self._run(spec))
+
+    async def _run(self, spec: Speculation) -> None:
+        try:
+            question_data, log_entry = await self.generator._get_discriminating_question(
+                self.role, self.query, spec.history, spec.outcomes
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Speculative expansion failed: {e}")
+            return
+        self._record(spec, question_data, log_entry)
+        for child in self._child_specs(spec):
+            self._launch(child)
+
+    async def expand(self, answer_node: AnswerNode) -> Optional[QuestionNode]:
+        """Reveal the speculative result for answer_node, or expand it normally."""
+        if answer_node.child is not None:
+            return answer_node.child
+        # Shared with expand_node(), so a reveal and a direct expansion of the same answer make one call
+        return await async_expansion_flights.do(answer_node.id, self._reveal, answer_node)
+
+    async def _reveal(self, answer_node: AnswerNode) -> Optional[QuestionNode]:
+        if answer_node.child is not None:
+            return answer_node.child
+        if answer_node.is_leaf:
+            return None
+
+        spec = self._claim(answer_node)
+        if spec is not None and spec.handle is not None and not spec.handle.done():
+            await asyncio.wait([spec.handle])
+
+        if answer_node.child is not None:
+            # Attached by someone else while the speculation was finishing
+            if spec is not None:
+                self._discard(spec)
+            return answer_node.child
+        if spec is not None and spec.result is not None:
+            question_node, event = self.generator._attach_question(
+                self.role, self.query, answer_node, *spec.result
+            )
+            if event is not None:
+                await self.generator._emit(event)
+            self.hits += 1
+            self._rekey(spec, question_node)
+        else:
+            self.misses += 1
+            # Already inside the shared flight for this answer, so expand directly
+            question_node = await self.generator._expand_once(self.role, self.query, answer_node)
+
+        if question_node:
+            self.speculate(question_node)
+        return question_node
+
+    def close(self) -> None:
+        """Discard all outstanding speculations."""
+        for spec in self._pending.values():
+            self._discard(spec)
+        self._pending.clear()
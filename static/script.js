@@ -55,23 +55,70 @@ function selectRole(role, cardElement) {
     cardElement.classList.add('selected');
 }
 
-let ws = new WebSocket(`ws://${window.location.host}/ws`);
-
-ws.onopen = () => {
-    console.log("Connected to WebSocket");
-};
-
-ws.onmessage = (event) => {
-    const data = JSON.parse(event.data);
-    console.log("Received data:", data);
-    handleMessage(data);
-};
+// Id of the tree this page is showing; events for other trees are ignored
+let currentTreeId = null;
+// Id the server gave this page's websocket; passed to /generate to subscribe to the new tree
+let connectionId = null;
+// Sequence number of the last event applied for the current tree; events are numbered per tree
+let lastSeq = 0;
+// Set while waiting for the server to replay missed events after a gap
+let resyncing = false;
+let reconnectDelay = 500;
+// Status shown before the connection dropped, restored on reconnect
+let statusBeforeDisconnect = null;
+
+let ws = null;
+connectWebSocket();
+
+function connectWebSocket() {
+    ws = new WebSocket(`ws://${window.location.host}/ws`);
+
+    ws.onopen = () => {
+        console.log("Connected to WebSocket");
+        reconnectDelay = 500;
+    };
+
+    ws.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        console.log("Received data:", data);
+        if (data.type === 'hello') {
+            connectionId = data.connection_id;
+            if (statusBeforeDisconnect) {
+                statusIndicator.textContent = statusBeforeDisconnect.text;
+                statusIndicator.classList.toggle('generating', statusBeforeDisconnect.generating);
+                statusBeforeDisconnect = null;
+            }
+            // Reconnected mid-tree: catch up from the last event we saw
+            if (currentTreeId) {
+                subscribe(currentTreeId);
+            }
+            return;
+        }
+        handleMessage(data);
+    };
+
+    ws.onclose = () => {
+        console.log("Disconnected from WebSocket, reconnecting");
+        if (!statusBeforeDisconnect) {
+            statusBeforeDisconnect = {
+                text: statusIndicator.textContent,
+                generating: statusIndicator.classList.contains('generating')
+            };
+        }
+        statusIndicator.textContent = "DISCONNECTED";
+        statusIndicator.classList.remove('generating');
+        connectionId = null;
+        resyncing = false;
+        setTimeout(connectWebSocket, reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, 10000);
+    };
+}
 
-ws.onclose = () => {
-    console.log("Disconnected from WebSocket");
-    statusIndicator.textContent = "DISCONNECTED";
-    statusIndicator.classList.remove('generating');
-};
+function subscribe(treeId) {
+    if (ws.readyState === WebSocket.OPEN) {
+        ws.send(JSON.stringify({ type: 'subscribe', tree_id: treeId, last_seq: lastSeq }));
+    }
+}
 
 form.addEventListener('submit', async (e) => {
     e.preventDefault();
@@ -82,6 +129,9 @@ form.addEventListener('submit', async (e) => {
 
     // Clear previous tree
     treeContainer.innerHTML = '';
+    currentTreeId = null;
+    lastSeq = 0;
+    resyncing = false;
     statusIndicator.textContent = "GENERATING...";
     statusIndicator.classList.add('generating');
 
@@ -91,13 +141,19 @@ form.addEventListener('submit', async (e) => {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ role, query, mode })
+            body: JSON.stringify({ role, query, mode, connection_id: connectionId })
         });
 
         if (!response.ok) {
             throw new Error('Failed to start generation');
         }
 
+        const result = await response.json();
+        currentTreeId = result.tree_id;
+        // Covers a websocket that connected after the request was sent; events
+        // already received are skipped by their sequence numbers
+        subscribe(currentTreeId);
+
     } catch (error) {
         console.error(error);
         statusIndicator.textContent = "ERROR";
@@ -107,12 +163,39 @@ form.addEventListener('submit', async (e) => {
 });
 
 function handleMessage(data) {
+    if (data.tree_id && data.tree_id !== currentTreeId) {
+        return;
+    }
+
+    if (data.type === 'snapshot') {
+        renderSnapshot(data);
+        return;
+    }
+    if (data.seq !== undefined) {
+        if (data.seq <= lastSeq) {
+            return; // Already applied (replayed or sent twice)
+        }
+        if (data.seq > lastSeq + 1) {
+            // Missed events (e.g. dropped while this client was slow): ask for a replay
+            if (!resyncing) {
+                resyncing = true;
+                subscribe(currentTreeId);
+            }
+            return;
+        }
+        lastSeq = data.seq;
+        resyncing = false;
+    }
+
     if (data.type === 'root') {
         renderRoot(data.node);
+    } else if (data.type === 'partial_expand') {
+        renderPartialExpansion(data.parent_answer_id, data);
     } else if (data.type === 'expand') {
         renderExpansion(data.parent_answer_id, data.node);
         removeGeneratingClass(data.parent_answer_id);
     } else if (data.type === 'leaf') {
+        removePartialExpansion(data.parent_answer_id);
         renderConclusion(data.parent_answer_id, data.outcome);
         removeGeneratingClass(data.parent_answer_id);
         statusIndicator.textContent = "CONCLUSION REACHED";
@@ -127,6 +210,36 @@ function handleMessage(data) {
     }
 }
 
+// Snapshots use the saved-tree format (to_dict); convert to the event format
+function snapshotNode(node) {
+    return {
+        id: node.id,
+        question: node.question,
+        answers: node.answers.map(ans => ({ id: ans.id, text: ans.answer_text, outcomes: ans.potential_outcomes }))
+    };
+}
+
+function renderSnapshot(data) {
+    renderRoot(snapshotNode(data.tree));
+    const pending = [data.tree];
+    while (pending.length > 0) {
+        const question = pending.pop();
+        question.answers.forEach(ans => {
+            if (ans.child) {
+                const container = document.getElementById(`child-container-${ans.id}`);
+                container.appendChild(createQuestionElement(snapshotNode(ans.child)));
+                pending.push(ans.child);
+            }
+        });
+    }
+    lastSeq = data.seq;
+    resyncing = false;
+    if (data.complete) {
+        statusIndicator.textContent = "COMPLETE";
+        statusIndicator.classList.remove('generating');
+    }
+}
+
 function removeGeneratingClass(answerId) {
     const answerElement = document.getElementById(`answer-${answerId}`);
     if (answerElement) {
@@ -207,8 +320,57 @@ function renderRoot(node) {
     treeContainer.appendChild(el);
 }
 
+// Streamed preview of a question that is still being generated; replaced by the final expand event
+function renderPartialExpansion(parentAnswerId, data) {
+    const container = document.getElementById(`child-container-${parentAnswerId}`);
+    if (!container || container.querySelector(':scope > .question-node:not(.partial)')) {
+        return;
+    }
+    const div = document.createElement('div');
+    div.className = 'question-node partial';
+    div.id = `partial-${parentAnswerId}`;
+    div.style.opacity = '0.6';
+
+    const text = document.createElement('div');
+    text.className = 'question-text';
+    text.textContent = `Q: ${data.question}`;
+    div.appendChild(text);
+
+    const answersContainer = document.createElement('div');
+    answersContainer.className = 'answers-container';
+    data.answers.forEach(ans => {
+        const ansDiv = document.createElement('div');
+        ansDiv.className = 'answer-node generating';
+        const ansText = document.createElement('div');
+        ansText.className = 'answer-text';
+        ansText.textContent = ans.text;
+        ansDiv.appendChild(ansText);
+        answersContainer.appendChild(ansDiv);
+    });
+    div.appendChild(answersContainer);
+
+    const existing = document.getElementById(div.id);
+    if (existing) {
+        existing.replaceWith(div);
+    } else {
+        container.appendChild(div);
+    }
+}
+
+function removePartialExpansion(parentAnswerId) {
+    const partial = document.getElementById(`partial-${parentAnswerId}`);
+    if (partial) {
+        partial.remove();
+    }
+}
+
 function renderExpansion(parentAnswerId, node) {
+    removePartialExpansion(parentAnswerId);
     const container = document.getElementById(`child-container-${parentAnswerId}`);
+    if (document.getElementById(`question-${node.id}`)) {
+        // Already rendered (the same expansion can be sent more than once)
+        return;
+    }
     if (container) {
         const el = createQuestionElement(node);
         container.appendChild(el);
@@ -275,7 +437,7 @@ async function handleAnswerClick(answerId) {
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ role, query, answer_id: answerId })
+            body: JSON.stringify({ tree_id: currentTreeId, role, query, answer_id: answerId, connection_id: connectionId })
         });
 
         if (!response.ok) {
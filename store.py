@@ -0,0 +1,158 @@
+"""Registry of generated trees for the web server, with LRU eviction to logs/."""
+
+import asyncio
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from tree import (
+    QuestionNode,
+    is_complete,
+    tree_filename,
+    snapshot_data,
+    write_snapshot_data,
+    load_tree_from_json,
+    load_tree_from_journal,
+)
+from persistence import TreeJournal, tree_writer
+
+
+class StoredTree:
+    """A registered tree. When evicted, root is None and the tree lives only on disk."""
+
+    def __init__(self, root: QuestionNode, role: str, query: str, model: str):
+        self.tree_id = root.id
+        self.root: Optional[QuestionNode] = root
+        self.role = role
+        self.query = query
+        self.model = model
+        self.path = tree_filename(root, role, query)
+        self.journal_path = tree_filename(root, role, query, ".journal.jsonl")
+        self.active = 0  # Number of requests currently using this tree
+        self.checkouts = 0  # Total checkouts, to notice use while an eviction write was in progress
+        self.speculator: Optional[Any] = None  # Set when speculative prefetch is enabled
+
+    @property
+    def node_count(self) -> int:
+        return len(self.root.node_index) if self.root is not None else 0
+
+
+class TreeStore:
+    """
+    Keeps generated trees in memory keyed by tree id, up to max_nodes nodes in total.
+    Least recently used trees that are not in use are written to their logs/ file
+    and dropped from memory, then reloaded on the next checkout.
+    Use from a single event loop; disk reads and writes run in threads.
+    """
+
+    def __init__(self, max_nodes: int = 50000, catalog: Optional[Any] = None):
+        self.max_nodes = max_nodes
+        # Optional catalog.TreeCatalog told about snapshots written on eviction
+        self.catalog = catalog
+        self._trees: "OrderedDict[str, StoredTree]" = OrderedDict()
+        # Loading and eviction touch disk under this lock; both are rare compared to lookups
+        self._lock = asyncio.Lock()
+
+    async def add(self, root: QuestionNode, role: str, query: str, model: str) -> StoredTree:
+        """Register a tree and evict others if the memory cap is exceeded."""
+        entry = StoredTree(root, role, query, model)
+        self._trees[entry.tree_id] = entry
+        self._trees.move_to_end(entry.tree_id)
+        await self._evict()
+        return entry
+
+    def get(self, tree_id: str) -> Optional[StoredTree]:
+        """Return the entry for tree_id without loading or pinning its tree."""
+        return self._trees.get(tree_id)
+
+    def __contains__(self, tree_id: str) -> bool:
+        return tree_id in self._trees
+
+    @asynccontextmanager
+    async def checkout(self, tree_id: str) -> AsyncIterator[StoredTree]:
+        """
+        Use a tree, reloading it from disk if it was evicted.
+        The tree cannot be evicted while checked out. Raises KeyError if unknown.
+        """
+        entry = self._trees[tree_id]
+        if entry.root is None:
+            async with self._lock:
+                # Checked again: another checkout may have loaded it while this one waited
+                if entry.root is None:
+                    entry.root = await asyncio.to_thread(self._load, entry)
+        entry.active += 1
+        entry.checkouts += 1
+        self._trees.move_to_end(tree_id)
+        try:
+            yield entry
+        finally:
+            entry.active -= 1
+            await self._evict()
+
+    def _load(self, entry: StoredTree) -> QuestionNode:
+        # A journal is only left behind if writing the snapshot failed, so it wins
+        if os.path.exists(entry.journal_path):
+            root, _ = load_tree_from_journal(entry.journal_path)
+        else:
+            root, _ = load_tree_from_json(entry.path)
+        print(f"Reloaded tree {entry.tree_id} from disk")
+        return root
+
+    async def _evict(self) -> None:
+        """Write out and drop least recently used idle trees until under the cap."""
+        if sum(entry.node_count for entry in self._trees.values()) <= self.max_nodes:
+            return
+        async with self._lock:
+            # Recounted: trees may have been evicted or loaded while this call waited
+            total = sum(entry.node_count for entry in self._trees.values())
+            for entry in list(self._trees.values()):
+                if total <= self.max_nodes:
+                    break
+                if entry.root is None or entry.active:
+                    continue
+                checkouts = entry.checkouts
+                if not await self._write(entry):
+                    continue
+                # Used while being written: the file may be stale, and the tree is recent again
+                if entry.active or entry.checkouts != checkouts:
+                    continue
+                total -= entry.node_count
+                self._drop(entry)
+
+    def _drop(self, entry: StoredTree) -> None:
+        entry.root = None
+        if entry.speculator is not None:
+            # Speculations hold references into the dropped tree
+            entry.speculator.close()
+            entry.speculator = None
+
+    async def _write(self, entry: StoredTree) -> bool:
+        """Make sure the snapshot on disk is current before dropping the tree."""
+        # Let queued journal appends and snapshots of async generators land before checking the files
+        await asyncio.wrap_future(tree_writer.flush())
+        journal = TreeJournal(entry.journal_path)
+        if os.path.exists(entry.path) and not journal.exists():
+            return True  # Snapshot mode keeps the file current after every change
+        # Captured on the loop; the tree may change while the thread writes
+        root = entry.root
+        data = snapshot_data(root, entry.role, entry.query, entry.model)
+        nodes, complete = len(root.node_index), is_complete(root)
+
+        def write() -> bool:
+            if not write_snapshot_data(entry.path, data):
+                return False
+            journal.remove()
+            if self.catalog is not None:
+                self.catalog.add(entry.path, root, entry.role, entry.query, entry.model, nodes, complete)
+            return True
+        return await asyncio.to_thread(write)
+
+    def stats(self) -> Dict[str, Any]:
+        loaded = [entry for entry in self._trees.values() if entry.root is not None]
+        return {
+            "trees": len(self._trees),
+            "loaded": len(loaded),
+            "nodes_in_memory": sum(entry.node_count for entry in loaded),
+            "max_nodes": self.max_nodes,
+        }
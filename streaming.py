@@ -0,0 +1,93 @@
+"""
+Incremental parsing of streamed structured output, so the parts of a question
+that are already complete can be shown before the response finishes.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """
+    Parse the longest prefix of text that ends on a complete value, closing any
+    open objects and arrays. Unfinished strings, keys and literals are left out,
+    so every string in the result is complete. Returns None if nothing parses yet.
+    """
+    stack: List[str] = []
+    # Per open container: True while the next string in an object is a key
+    expect_key: List[bool] = []
+    in_string = escaped = False
+    string_is_key = False
+    safe_end, safe_stack = 0, ""
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if not string_is_key:
+                    safe_end, safe_stack = i + 1, "".join(stack)
+            continue
+        if char == '"':
+            in_string = True
+            string_is_key = bool(expect_key) and expect_key[-1]
+        elif char in "{[":
+            stack.append(char)
+            expect_key.append(char == "{")
+            safe_end, safe_stack = i + 1, "".join(stack)
+        elif char in "}]":
+            if not stack:
+                break
+            stack.pop()
+            expect_key.pop()
+            safe_end, safe_stack = i + 1, "".join(stack)
+        elif char == ",":
+            # Whatever came before the comma was a complete value
+            safe_end, safe_stack = i, "".join(stack)
+            if stack and stack[-1] == "{":
+                expect_key[-1] = True
+        elif char == ":":
+            expect_key[-1] = False
+
+    if safe_end == 0:
+        return None
+    completed = text[:safe_end] + "".join(_CLOSERS[c] for c in reversed(safe_stack))
+    try:
+        return json.loads(completed)
+    except ValueError:
+        return None
+
+
+class PartialQuestion:
+    """
+    Follows the streamed text of a QuestionSchema response. update() returns the
+    parts that are known to be final whenever they grow: the question once its
+    text is complete, and each answer once the next one has started (the last
+    answer only arrives with the final response).
+    """
+
+    def __init__(self):
+        self.question: Optional[str] = None
+        self.answers: List[Dict[str, Any]] = []
+
+    def update(self, text: str) -> Optional[Dict[str, Any]]:
+        data = parse_partial_json(text)
+        if not isinstance(data, dict) or not isinstance(data.get("question"), str):
+            return None
+        answers = data.get("answers")
+        ready = answers[:-1] if isinstance(answers, list) else []
+        ready = [
+            {"text": answer["answer_text"], "outcomes": answer["potential_outcomes"]}
+            for answer in ready
+            if isinstance(answer, dict) and "answer_text" in answer and "potential_outcomes" in answer
+        ]
+        if data["question"] == self.question and len(ready) <= len(self.answers):
+            return None
+        self.question = data["question"]
+        self.answers = ready
+        return {"question": self.question, "answers": list(self.answers)}
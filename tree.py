@@ -1,19 +1,38 @@
-from typing import List, Optional, Union, Callable, Dict, Any
+from typing import List, Optional, Union, Callable, Dict, Any, Iterator
 import uuid
-import json
 import time
 import os
 import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from pydantic import BaseModel
 from openai import OpenAI
-from config import MAX_DEPTH
+from config import MAX_DEPTH, INTERN_OUTCOMES, LOG_STORAGE
+from persistence import TreeJournal
+from cache import ResponseCache
+from metrics import record_llm_call, SAVE_DURATION
+from ratelimit import AdaptiveLimiter, RETRYABLE_ERRORS, call_with_retry, shared_limiter
+from singleflight import SingleFlight
+from scheduler import ExpansionScheduler, GenerationBudget
 from prompts import (
     INITIAL_SYSTEM_PROMPT,
     INITIAL_USER_PROMPT,
     DISCRIMINATING_SYSTEM_PROMPT,
     DISCRIMINATING_USER_PROMPT,
+    SUBTREE_SYSTEM_PROMPT,
+    COMPACT_INITIAL_SYSTEM_PROMPT,
+    COMPACT_INITIAL_USER_PROMPT,
+    COMPACT_DISCRIMINATING_SYSTEM_PROMPT,
+    COMPACT_DISCRIMINATING_USER_PROMPT,
+    COMPACT_SUBTREE_SYSTEM_PROMPT,
 )
+from prompt_encoding import compact_history, encode_outcomes, decode_outcomes, estimate_tokens
+from log_storage import COMPRESSED_EXTENSION, dump_snapshot, load_snapshot
+
+# Extension of new snapshots in logs/, which also selects their format (see log_storage.py)
+SNAPSHOT_EXTENSION = COMPRESSED_EXTENSION if LOG_STORAGE == "compact" else ".json"
 
 # Structured output schemas
 class AnswerSchema(BaseModel):
@@ -24,15 +43,101 @@ class QuestionSchema(BaseModel):
     question: str
     answers: list[AnswerSchema]
 
+# Recursive schema for multi-level expansion: each answer may carry its follow-up question
+class SubtreeAnswerSchema(BaseModel):
+    answer_text: str
+    potential_outcomes: list[str]
+    follow_up: Optional["SubtreeQuestionSchema"] = None
+
+class SubtreeQuestionSchema(BaseModel):
+    question: str
+    answers: list[SubtreeAnswerSchema]
+
+SubtreeAnswerSchema.model_rebuild()
+
+# In-flight expand_node() calls by answer id, shared by every generator in the process
+expansion_flights = SingleFlight()
+
 class DecisionTreeGenerator:
     """Generates a decision tree using an LLM."""
 
-    def __init__(self, client: OpenAI, llm_model: str, callback: Optional[Callable[[dict], None]] = None):
+    def __init__(
+        self,
+        client: OpenAI,
+        llm_model: str,
+        callback: Optional[Callable[[dict], None]] = None,
+        max_workers: int = 1,
+        persistence: str = "snapshot",
+        cache: Optional[ResponseCache] = None,
+        bypass_cache: bool = False,
+        priority: str = "outcomes",
+        expansion_levels: int = 1,
+        reuse_subtrees: bool = False,
+        limiter: Optional[AdaptiveLimiter] = None,
+        catalog: Optional[Any] = None,
+        prompt_encoding: str = "full",
+        on_expansion: Optional[Callable[[float], None]] = None,
+    ):
+        """
+        Args:
+            max_workers: Maximum expansions in flight during recursive generation.
+            persistence: "snapshot" rewrites the full JSON file after every change.
+                         "journal" appends one record per change and writes the
+                         snapshot only when the tree is compacted.
+            cache: Optional response cache shared between generators.
+            bypass_cache: If True, always call the LLM but still refresh the cache.
+            priority: Order in which recursive generation expands answers:
+                      "outcomes" (largest outcome set first), "shallow" or "deep".
+            expansion_levels: Question levels requested per expansion call. Above 1,
+                      the LLM returns a nested subtree that is grafted in one go;
+                      follow-ups whose outcomes are not a subset of their answer's
+                      are dropped and those answers expand one level at a time.
+            reuse_subtrees: If True, an answer whose outcome set matches a branch
+                      already generated in the same tree gets a copy of that
+                      branch's subtree instead of a new LLM call.
+            limiter: Adaptive concurrency limit for LLM calls. Defaults to the
+                      process-wide limiter shared by all generators.
+            catalog: Optional catalog.TreeCatalog that records every snapshot written.
+            prompt_encoding: "full" or "compact" (role-independent system prompts,
+                      Q:/A: paths and outcome ids; see prompt_encoding.py).
+            on_expansion: Called with the seconds each expansion took (LLM call plus
+                      attach, persist and callback), e.g. for benchmarks.
+        """
+        if persistence not in ("snapshot", "journal"):
+            raise ValueError(f"Unknown persistence mode: {persistence}")
+        if prompt_encoding not in ("full", "compact"):
+            raise ValueError(f"Unknown prompt encoding: {prompt_encoding}")
         self.client = client
         self.llm_model = llm_model
         self.callback = callback
+        self.max_workers = max(1, max_workers)
+        self.persistence = persistence
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self.priority = priority
+        self.expansion_levels = max(1, expansion_levels)
+        # Answers whose grafted follow-up failed validation; expanded single-level
+        self._single_level: set[str] = set()
+        self.reuse_subtrees = reuse_subtrees
+        # Questions copied from matching branches, i.e. LLM calls saved
+        self.reused_questions = 0
+        self.limiter = limiter if limiter is not None else shared_limiter()
+        self.catalog = catalog
+        self.prompt_encoding = prompt_encoding
+        self.on_expansion = on_expansion
+        # Budget usage and stop reason of the last recursive run
+        self.last_run: Optional[Dict[str, Any]] = None
+        # Guards tree mutation, logs, callbacks and saving when branches expand concurrently
+        self._lock = threading.RLock()
 
-    def generate(self, role: str, query: str, recursive: bool = True) -> "QuestionNode":
+    def generate(
+        self,
+        role: str,
+        query: str,
+        recursive: bool = True,
+        tree_id: Optional[str] = None,
+        budget: Optional[GenerationBudget] = None,
+    ) -> "QuestionNode":
         """
         Main entry point to generate the decision tree.
         
@@ -41,138 +146,563 @@ class DecisionTreeGenerator:
             query: The initial user query.
             recursive: If True, generates the full tree recursively. 
                        If False, generates only the root question.
+                       With max_workers > 1, sibling branches are expanded in parallel.
+            tree_id: Optional id for the root node, so callers can reference the
+                     tree before generation finishes.
+            budget: Limits for recursive generation. When it runs out, unexpanded
+                    answers are marked as frontier and can be continued with resume().
         """
         print(f"Fetching initial question for: {query}")
         initial_data, log_entry = self._get_initial_question(role, query)
-        
-        root = QuestionNode(initial_data.question)
-        root.logs.append(log_entry) # Store initial log
 
-        for answer in initial_data.answers:
-            root.add_answer(answer.answer_text, answer.potential_outcomes)
-            
+        root, event = self._create_root(role, query, initial_data, log_entry, tree_id)
         if self.callback:
-            self.callback({
-                "type": "root",
-                "node": self._serialize_node(root)
-            })
-        
-        # Save initial state
-        self.save_tree_to_json(root, role, query)
+            self.callback(event)
 
         if recursive:
             print("Building decision tree recursively...")
-            for answer_node in root.answers:
-                self._build_recursive(role, query, answer_node, root)
-            
+            self._build(role, query, root, root.answers, budget)
+
+        return root
+
+    def resume(
+        self, root: "QuestionNode", role: str, query: str, budget: Optional[GenerationBudget] = None
+    ) -> "QuestionNode":
+        """Continue recursive generation from the answers marked as frontier by an earlier run."""
+        frontier = [node for node in root.iter_subtree() if isinstance(node, AnswerNode) and node.frontier]
+        for answer in frontier:
+            answer.frontier = False
+        print(f"Resuming generation from {len(frontier)} frontier answers...")
+        self._build(role, query, root, frontier, budget)
         return root
 
+    def build(
+        self, root: "QuestionNode", role: str, query: str, budget: Optional[GenerationBudget] = None
+    ) -> "QuestionNode":
+        """
+        Recursively expand a root created with recursive=False. Lets callers
+        register the root (e.g. in a store) before the rest of the tree exists.
+        """
+        print("Building decision tree recursively...")
+        self._build(role, query, root, root.answers, budget)
+        return root
+
+    def _build(
+        self,
+        role: str,
+        query: str,
+        root: "QuestionNode",
+        answers: List["AnswerNode"],
+        budget: Optional[GenerationBudget],
+    ) -> None:
+        """Expand answers and their descendants in priority order until done or out of budget."""
+        scheduler = ExpansionScheduler(budget, self.priority)
+        for answer in answers:
+            scheduler.push(answer)
+        self._run_scheduler(role, query, scheduler)
+        self._finish_run(role, query, root, scheduler)
+
+    def _finish_run(self, role: str, query: str, root: "QuestionNode", scheduler: ExpansionScheduler) -> None:
+        """Mark leftover answers as frontier and write the final snapshot."""
+        with self._lock:
+            remaining = scheduler.mark_frontier()
+            self.last_run = scheduler.report()
+            failed = self.last_run["failed"]
+            if scheduler.stop_reason not in (None, "errors"):
+                print(f"Stopped ({scheduler.stop_reason} budget reached): "
+                      f"{remaining - failed} answers left to resume")
+            if failed:
+                print(f"{failed} expansions failed: answers left to resume")
+            if self.persistence == "journal":
+                self.compact(root, role, query)
+            elif remaining:
+                self._save_snapshot(root, role, query)
+
     def _get_initial_question(self, role: str, query: str) -> tuple[QuestionSchema, Dict[str, Any]]:
         """Get initial question with answers and outcomes."""
-        system_prompt = INITIAL_SYSTEM_PROMPT.format(role=role)
-        user_prompt = INITIAL_USER_PROMPT.format(query=query)
+        system_prompt, user_prompt = self._initial_prompts(role, query)
 
         start_time = time.time()
-        response = self.client.beta.chat.completions.parse(
-            model=self.llm_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            response_format=QuestionSchema,
-        )
+        response_json, cached, usage = self._parse_question(system_prompt, user_prompt)
         duration = time.time() - start_time
-        response_json = response.choices[0].message.parsed
         print(f"Root Question: {response_json.question}")
 
-        log_entry = {
-            "timestamp": datetime.now().isoformat(),
-            "type": "initial_question",
-            "duration_seconds": duration,
-            "system_prompt": system_prompt,
-            "user_prompt": user_prompt,
-            "response": response_json.model_dump()
-        }
+        log_entry = self._log_entry(
+            "initial_question", duration, cached, system_prompt, user_prompt, response_json, usage
+        )
+        self._note_savings(log_entry, self._initial_prompts, role, query)
+        record_llm_call(self.llm_model, role, log_entry)
         return response_json, log_entry
 
     def _get_discriminating_question(
         self, role: str, query: str, history: str, outcomes: list[str]
     ) -> tuple[QuestionSchema, Dict[str, Any]]:
         """Get the most discriminating question for current branch."""
+        system_prompt, user_prompt = self._discriminating_prompts(role, query, history, outcomes)
+
+        start_time = time.time()
+        response_json, cached, usage = self._parse_question(system_prompt, user_prompt)
+        duration = time.time() - start_time
+        response_json = self._decode(response_json, outcomes)
+        log_entry = self._log_entry(
+            "discriminating_question", duration, cached, system_prompt, user_prompt, response_json, usage
+        )
+        self._note_savings(log_entry, self._discriminating_prompts, role, query, history, outcomes)
+        record_llm_call(self.llm_model, role, log_entry)
+        return response_json, log_entry
+
+    def _get_subtree(
+        self, role: str, query: str, history: str, outcomes: list[str]
+    ) -> tuple[SubtreeQuestionSchema, Dict[str, Any]]:
+        """Get the next question with nested follow-ups, expansion_levels deep."""
+        system_prompt, user_prompt = self._subtree_prompts(role, query, history, outcomes)
+
+        start_time = time.time()
+        response_json, cached, usage = self._parse_question(system_prompt, user_prompt, SubtreeQuestionSchema)
+        duration = time.time() - start_time
+        response_json = self._decode(response_json, outcomes)
+        log_entry = self._log_entry(
+            "subtree_question", duration, cached, system_prompt, user_prompt, response_json, usage
+        )
+        self._note_savings(log_entry, self._subtree_prompts, role, query, history, outcomes)
+        record_llm_call(self.llm_model, role, log_entry)
+        return response_json, log_entry
+
+    def _initial_prompts(self, role: str, query: str, encoding: Optional[str] = None) -> tuple[str, str]:
+        """Render the system and user prompts for the root question."""
+        if (encoding or self.prompt_encoding) == "compact":
+            return COMPACT_INITIAL_SYSTEM_PROMPT.format(), COMPACT_INITIAL_USER_PROMPT.format(role=role, query=query)
+        return INITIAL_SYSTEM_PROMPT.format(role=role), INITIAL_USER_PROMPT.format(query=query)
+
+    def _discriminating_prompts(
+        self, role: str, query: str, history: str, outcomes: list[str], encoding: Optional[str] = None
+    ) -> tuple[str, str]:
+        """Render the system and user prompts for a follow-up question."""
+        if (encoding or self.prompt_encoding) == "compact":
+            user_prompt = COMPACT_DISCRIMINATING_USER_PROMPT.format(
+                role=role, query=query, history=compact_history(history), outcomes=encode_outcomes(outcomes)
+            )
+            return COMPACT_DISCRIMINATING_SYSTEM_PROMPT.format(), user_prompt
         system_prompt = DISCRIMINATING_SYSTEM_PROMPT.format(role=role)
         outcomes_text = "\n".join(f"- {outcome}" for outcome in outcomes)
         user_prompt = DISCRIMINATING_USER_PROMPT.format(
             query=query, history=history, outcomes=outcomes_text
         )
+        return system_prompt, user_prompt
 
-        start_time = time.time()
-        response = self.client.beta.chat.completions.parse(
-            model=self.llm_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            response_format=QuestionSchema,
-        )
-        duration = time.time() - start_time
-        return response.choices[0].message.parsed, {
+    def _subtree_prompts(
+        self, role: str, query: str, history: str, outcomes: list[str], encoding: Optional[str] = None
+    ) -> tuple[str, str]:
+        """Render the prompts for a multi-level expansion; the user prompt matches the single-level one."""
+        _, user_prompt = self._discriminating_prompts(role, query, history, outcomes, encoding)
+        if (encoding or self.prompt_encoding) == "compact":
+            return COMPACT_SUBTREE_SYSTEM_PROMPT.format(levels=self.expansion_levels), user_prompt
+        return SUBTREE_SYSTEM_PROMPT.format(role=role, levels=self.expansion_levels), user_prompt
+
+    def _decode(self, response: BaseModel, outcomes: list[str]) -> BaseModel:
+        """Map outcome ids in a compact-mode response back to the outcome texts."""
+        if self.prompt_encoding != "compact":
+            return response
+        return decode_outcomes(response, outcomes)
+
+    def _note_savings(self, log_entry: Dict[str, Any], render: Callable[..., tuple[str, str]], *args: Any) -> None:
+        """In compact mode, record the estimated prompt tokens saved versus rendering the call in full."""
+        if self.prompt_encoding != "compact" or log_entry["cached"]:
+            return
+        full = estimate_tokens(*render(*args, encoding="full"))
+        log_entry["prompt_tokens_saved"] = full - estimate_tokens(log_entry["system_prompt"], log_entry["user_prompt"])
+
+    def _log_entry(
+        self,
+        log_type: str,
+        duration: float,
+        cached: bool,
+        system_prompt: str,
+        user_prompt: str,
+        response: BaseModel,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> Dict[str, Any]:
+        """Build the log entry recorded for one question call."""
+        return {
             "timestamp": datetime.now().isoformat(),
-            "type": "discriminating_question",
+            "type": log_type,
             "duration_seconds": duration,
+            "cached": cached,
+            "usage": usage,
             "system_prompt": system_prompt,
             "user_prompt": user_prompt,
-            "response": response.choices[0].message.parsed.model_dump()
+            "response": response.model_dump()
         }
 
-    def expand_node(self, role: str, query: str, answer_node: "AnswerNode") -> Optional["QuestionNode"]:
+    def _parse_question(
+        self, system_prompt: str, user_prompt: str, schema: type[BaseModel] = QuestionSchema
+    ) -> tuple[BaseModel, bool, Optional[Dict[str, int]]]:
         """
-        Expand a single answer node by generating the next question.
-        Returns the new QuestionNode if created, or None if it's a leaf.
+        Request a structured response (QuestionSchema by default), serving it from the cache when possible.
+        Returns the parsed response, whether it came from the cache, and token usage
+        (None for cache hits or when the provider does not report it).
         """
-        if answer_node.is_leaf:
-            return None
+        key, cached = self._cache_lookup(system_prompt, user_prompt, schema)
+        if cached is not None:
+            return cached, True, None
 
-        # Get next discriminating question
-        history = answer_node.get_history_str()
-        question_data, log_entry = self._get_discriminating_question(
-            role, query, history, answer_node.potential_outcomes
+        # Transient errors (429s, timeouts) are retried with backoff under the shared limiter
+        response = call_with_retry(
+            lambda: self.client.beta.chat.completions.parse(
+                model=self.llm_model,
+                messages=self._messages(system_prompt, user_prompt),
+                response_format=schema,
+            ),
+            self.llm_model,
+            self.limiter,
         )
-        
+        parsed = response.choices[0].message.parsed
+        self._cache_store(key, parsed)
+        return parsed, False, self._usage(response)
+
+    def _usage(self, response: Any) -> Optional[Dict[str, int]]:
+        """Extract token counts from a completion response."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return None
+        return {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.total_tokens,
+        }
+
+    def _messages(self, system_prompt: str, user_prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def _cache_lookup(
+        self, system_prompt: str, user_prompt: str, schema: type[BaseModel] = QuestionSchema
+    ) -> tuple[Optional[str], Optional[BaseModel]]:
+        """Return the cache key (None without a cache) and the cached response, if any."""
+        if self.cache is None:
+            return None, None
+        key = ResponseCache.make_key(self.llm_model, system_prompt, user_prompt)
+        if self.bypass_cache:
+            return key, None
+        cached = self.cache.get(key)
+        return key, schema.model_validate(cached) if cached is not None else None
+
+    def _cache_store(self, key: Optional[str], response: BaseModel) -> None:
+        if key is not None:
+            self.cache.set(key, response.model_dump())
+
+    def _create_root(
+        self,
+        role: str,
+        query: str,
+        initial_data: QuestionSchema,
+        log_entry: Dict[str, Any],
+        tree_id: Optional[str] = None,
+    ) -> tuple["QuestionNode", Dict[str, Any]]:
+        """Build and persist the root node. Returns it with its "root" callback event."""
+        root = QuestionNode(initial_data.question, node_id=tree_id)
+        root.logs.append(log_entry) # Store initial log
+
+        for answer in initial_data.answers:
+            root.add_answer(answer.answer_text, answer.potential_outcomes)
+
+        # Save initial state
+        self._persist(root, role, query, {
+            "type": "root",
+            "node": root.to_dict(),
+            "log": log_entry
+        })
+        return root, {
+            "type": "root",
+            "tree_id": root.id,
+            "node": self._serialize_node(root)
+        }
+
+    def _attach_question(
+        self,
+        role: str,
+        query: str,
+        answer_node: "AnswerNode",
+        question_data: Union[QuestionSchema, SubtreeQuestionSchema],
+        log_entry: Optional[Dict[str, Any]],
+    ) -> tuple["QuestionNode", Optional[Dict[str, Any]]]:
+        """
+        Attach a generated question under answer_node and persist the change.
+        Returns the new node with its "expand" callback event. log_entry is None
+        for follow-ups grafted from a subtree whose call is logged on its top question.
+        An answer that already has a child keeps it: that child is returned with no event.
+        """
+        if answer_node.child is not None:
+            print(f"  Keeping existing branch: {answer_node.answer_text[:30]}... -> {answer_node.child.question}")
+            return answer_node.child, None
+
         # Find root to append logs
         root = answer_node.root
-        if hasattr(root, 'logs'):
+        if log_entry is not None:
             root.logs.append(log_entry)
-        
+
         print(f"  Extending branch: {answer_node.answer_text[:30]}... -> {question_data.question}")
 
         # Create question node
         question_node = QuestionNode(question_data.question)
         answer_node.set_child(question_node)
+        answer_node.frontier = False
+        if self.reuse_subtrees:
+            _subtree_memo(root).setdefault(_outcome_key(answer_node.potential_outcomes), question_node)
 
         # Add answers
         for answer in question_data.answers:
             question_node.add_answer(answer.answer_text, answer.potential_outcomes)
-            
-        if self.callback:
-            self.callback({
+
+        # Save updated tree
+        self._persist(root, role, query, {
+            "type": "expand",
+            "parent_id": answer_node.id,
+            "node": question_node.to_dict(),
+            "log": log_entry
+        })
+        return question_node, {
+            "type": "expand",
+            "tree_id": root.id,
+            "parent_answer_id": answer_node.id,
+            "node": self._serialize_node(question_node)
+        }
+
+    def _graft_subtree(
+        self,
+        role: str,
+        query: str,
+        answer_node: "AnswerNode",
+        subtree_data: SubtreeQuestionSchema,
+        log_entry: Dict[str, Any],
+        max_depth: int = MAX_DEPTH,
+    ) -> tuple["QuestionNode", List[Dict[str, Any]]]:
+        """
+        Attach a multi-level response under answer_node, parents before children.
+        A follow-up is grafted only under answers above max_depth, and only if every
+        one of its answers narrows to a non-empty subset of the outcomes of the answer
+        it hangs from; otherwise that answer is left for a single-level expansion.
+        Returns the top question and all "expand" events.
+        """
+        question_node, event = self._attach_question(role, query, answer_node, subtree_data, log_entry)
+        if event is None:
+            return question_node, []
+        events = [event]
+        stack = [(question_node, subtree_data)]
+        while stack:
+            node, data = stack.pop()
+            for answer, answer_data in zip(node.answers, data.answers):
+                follow_up = answer_data.follow_up
+                if follow_up is None or answer.is_leaf or answer.depth >= max_depth:
+                    continue
+                if not _narrows(answer.potential_outcomes, follow_up):
+                    self._single_level.add(answer.id)
+                    continue
+                child, event = self._attach_question(role, query, answer, follow_up, None)
+                events.append(event)
+                stack.append((child, follow_up))
+        return question_node, events
+
+    def _reuse_subtree(
+        self, role: str, query: str, answer_node: "AnswerNode", max_depth: int = MAX_DEPTH
+    ) -> tuple[Optional["QuestionNode"], List[Dict[str, Any]]]:
+        """
+        Copy the subtree of an earlier branch with the same outcome set under answer_node,
+        down to max_depth.
+        Returns the copied question and its "expand" events, or (None, []) if there is no match.
+        An answer that already has a child keeps it: that child is returned with no events.
+        """
+        if answer_node.child is not None:
+            return answer_node.child, []
+        root = answer_node.root
+        source = _subtree_memo(root).get(_outcome_key(answer_node.potential_outcomes))
+        if source is None or source.root is not root:
+            return None, []
+        # Copying a branch into its own descendant would never terminate
+        node = answer_node.parent
+        while node is not None:
+            if node is source:
+                return None, []
+            node = node.parent
+
+        question_node = QuestionNode(source.question)
+        answer_node.set_child(question_node)
+        answer_node.frontier = False
+        events = []
+        stack = [(source, question_node)]
+        while stack:
+            original, copy = stack.pop()
+            events.append({
                 "type": "expand",
-                "parent_answer_id": answer_node.id,
-                "node": self._serialize_node(question_node)
+                "tree_id": root.id,
+                "parent_answer_id": copy.parent.id,
+                "node": self._serialize_node(copy)
             })
-            
-        # Save updated tree
-        self.save_tree_to_json(root, role, query)
+            for answer in original.answers:
+                new_answer = node.add_answer(answer.answer_text, answer.potential_outcomes)
+                if answer.child is not None and new_answer.depth < max_depth:
+                    child = QuestionNode(answer.child.question)
+                    new_answer.set_child(child)
+                    stack.append((answer.child, child))
 
-        return question_node
+        self.reused_questions += len(events)
+        print(f"  Reusing branch: {answer_node.answer_text[:30]}... -> {source.question} ({len(events)} questions)")
+        self._persist(root, role, query, {
+            "type": "expand",
+            "parent_id": answer_node.id,
+            "node": question_node.to_dict(),
+            "log": None,
+            "reused_from": source.id
+        })
+        return question_node, events
 
-    def _build_recursive(self, role: str, query: str, answer_node: "AnswerNode", root: "QuestionNode") -> None:
-        """Recursively build tree from an answer node."""
-        question_node = self.expand_node(role, query, answer_node)
-        
-        if question_node:
-            # Recursively build subtrees
-            for child_answer in question_node.answers:
-                self._build_recursive(role, query, child_answer, root)
+    def _multi_level(self, answer_node: "AnswerNode", max_depth: int = MAX_DEPTH) -> bool:
+        # The new question's answers sit at depth + 2; at max_depth no follow-up could be grafted
+        return (
+            self.expansion_levels > 1
+            and answer_node.id not in self._single_level
+            and answer_node.depth + 2 < max_depth
+        )
+
+    def expand_node(self, role: str, query: str, answer_node: "AnswerNode") -> Optional["QuestionNode"]:
+        """
+        Expand a single answer node by generating the next question (and, with
+        expansion_levels > 1, its follow-ups). Returns the new QuestionNode if
+        created, or None if it's a leaf.
+        An answer that is already expanded returns its child without an LLM call,
+        and concurrent calls for the same answer share a single expansion.
+        """
+        if answer_node.child is not None:
+            return answer_node.child
+        return expansion_flights.do(answer_node.id, self._expand_once, role, query, answer_node)
+
+    def _expand_once(self, role: str, query: str, answer_node: "AnswerNode") -> Optional["QuestionNode"]:
+        # A call that finished just before this one started may already have attached the child
+        if answer_node.child is not None:
+            return answer_node.child
+        return self._timed_expand(role, query, answer_node)[0]
+
+    def _expand_scheduled(
+        self, role: str, query: str, answer_node: "AnswerNode", max_depth: int
+    ) -> tuple[Optional["QuestionNode"], Optional[Dict[str, Any]]]:
+        """
+        _expand for the scheduler, through the same single flight as expand_node, so an
+        answer expanded concurrently (e.g. by /expand) is not sent to the LLM twice.
+        The log entry is None when another call made the expansion.
+        """
+        log_entries = []
+
+        def expand() -> Optional["QuestionNode"]:
+            if answer_node.child is not None:
+                return answer_node.child
+            question_node, log_entry = self._timed_expand(role, query, answer_node, max_depth)
+            log_entries.append(log_entry)
+            return question_node
+
+        question_node = expansion_flights.do(answer_node.id, expand)
+        return question_node, (log_entries[0] if log_entries else None)
+
+    def _timed_expand(
+        self, role: str, query: str, answer_node: "AnswerNode", max_depth: int = MAX_DEPTH
+    ) -> tuple[Optional["QuestionNode"], Optional[Dict[str, Any]]]:
+        """_expand, reporting its wall time to on_expansion."""
+        if self.on_expansion is None:
+            return self._expand(role, query, answer_node, max_depth)
+        start = time.perf_counter()
+        result = self._expand(role, query, answer_node, max_depth)
+        self.on_expansion(time.perf_counter() - start)
+        return result
+
+    def _expand(
+        self, role: str, query: str, answer_node: "AnswerNode", max_depth: int = MAX_DEPTH
+    ) -> tuple[Optional["QuestionNode"], Optional[Dict[str, Any]]]:
+        """
+        expand_node, also returning the log entry of the LLM call (None if the subtree was reused).
+        max_depth is the depth limit of the running budget; grafted and reused questions stay above it.
+        """
+        if answer_node.is_leaf:
+            return None, None
+
+        if self.reuse_subtrees:
+            with self._lock:
+                question_node, events = self._reuse_subtree(role, query, answer_node, max_depth)
+                if self.callback:
+                    for event in events:
+                        self.callback(event)
+            if question_node is not None:
+                return question_node, None
+
+        history = answer_node.get_history_str()
+        if self._multi_level(answer_node, max_depth):
+            subtree_data, log_entry = self._get_subtree(role, query, history, answer_node.potential_outcomes)
+            with self._lock:
+                question_node, events = self._graft_subtree(
+                    role, query, answer_node, subtree_data, log_entry, max_depth
+                )
+                if self.callback:
+                    for event in events:
+                        self.callback(event)
+            return question_node, log_entry
+
+        # Get next discriminating question
+        question_data, log_entry = self._get_discriminating_question(
+            role, query, history, answer_node.potential_outcomes
+        )
+
+        with self._lock:
+            question_node, event = self._attach_question(role, query, answer_node, question_data, log_entry)
+            if self.callback and event is not None:
+                self.callback(event)
+
+        return question_node, log_entry
+
+    def _run_scheduler(self, role: str, query: str, scheduler: ExpansionScheduler) -> None:
+        """
+        Expand scheduled answers on a bounded thread pool, keeping up to max_workers
+        in flight. Children are queued as soon as their parent question is attached,
+        so with several workers wall time grows with tree depth rather than node count.
+        """
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending: Dict[Any, AnswerNode] = {}
+        try:
+            while True:
+                while len(pending) < self.max_workers:
+                    answer = scheduler.next()
+                    if answer is None:
+                        break
+                    future = executor.submit(self._expand_scheduled, role, query, answer, scheduler.budget.max_depth)
+                    pending[future] = answer
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    answer = pending.pop(future)
+                    try:
+                        question_node, log_entry = future.result()
+                    except RETRYABLE_ERRORS as e:
+                        # Out of retries: keep the rest of the tree going and leave this answer to resume()
+                        print(f"Expansion failed, leaving answer for resume: {e}")
+                        scheduler.defer(answer)
+                        continue
+                    if question_node:
+                        self._schedule_children(scheduler, question_node, log_entry)
+        finally:
+            # On error, drop queued expansions instead of finishing the whole tree
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _schedule_children(
+        self, scheduler: ExpansionScheduler, question_node: "QuestionNode", log_entry: Optional[Dict[str, Any]]
+    ) -> None:
+        """Charge an expansion to the budget and queue the open answers it created, grafted ones included."""
+        questions = 0
+        for node in question_node.iter_subtree():
+            if isinstance(node, AnswerNode):
+                scheduler.push(node)
+            else:
+                questions += 1
+        scheduler.charge(log_entry, questions)
 
     def _serialize_node(self, node: "QuestionNode") -> dict:
         """Helper to serialize a node for the callback."""
@@ -189,56 +719,275 @@ class DecisionTreeGenerator:
             ]
         }
 
-    def save_tree_to_json(self, root: "TreeNode", role: str, query: str) -> None:
-        """Saves the tree and logs to a JSON file."""
-        logs_dir = "logs"
-        if not os.path.exists(logs_dir):
-            os.makedirs(logs_dir)
+    def _tree_filename(self, root: "TreeNode", role: str, query: str, extension: str = SNAPSHOT_EXTENSION) -> str:
+        return tree_filename(root, role, query, extension)
 
-        # Sanitize filename
-        safe_role = re.sub(r'[^a-zA-Z0-9]', '_', role[:20])
-        safe_query = re.sub(r'[^a-zA-Z0-9]', '_', query[:30])
-        timestamp = datetime.fromtimestamp(root.created_at).strftime('%Y%m%d_%H%M%S')
-        filename = f"{logs_dir}/{timestamp}_{safe_role}_{safe_query}.json"
+    def _persist(self, root: "TreeNode", role: str, query: str, record: Dict[str, Any]) -> None:
+        """Persist a change using the configured persistence mode."""
+        if self.persistence == "journal":
+            self._append_journal(root, role, query, record)
+        else:
+            self._save_snapshot(root, role, query)
 
-        data = {
-            "meta": {
+    def _append_journal(self, root: "TreeNode", role: str, query: str, record: Dict[str, Any]) -> None:
+        """Append a record to the tree's journal, starting a new journal if needed."""
+        path = self._tree_filename(root, role, query, ".journal.jsonl")
+        self._journal_job(root, role, query, record, os.path.exists(path))()
+
+    def _journal_job(
+        self, root: "TreeNode", role: str, query: str, record: Dict[str, Any], journal_exists: bool
+    ) -> Callable[[], None]:
+        """Capture what a journal append needs now; the returned job writes it and may run on another thread."""
+        journal = TreeJournal(self._tree_filename(root, role, query, ".journal.jsonl"))
+        records = []
+        if not journal_exists:
+            records.append({
+                "type": "meta",
                 "role": role,
                 "query": query,
                 "model": self.llm_model,
-                "created_at": datetime.fromtimestamp(root.created_at).isoformat(),
-                "last_updated": datetime.now().isoformat()
-            },
-            "tree": root.to_dict(),
-            "logs": root.logs
-        }
+                "created_at": root.created_at
+            })
+            if record["type"] != "root":
+                # Journal restarted after compaction: seed it with the current tree
+                record = {"type": "tree", "tree": root.to_dict(), "logs": list(root.logs)}
+        records.append(record)
+
+        def job() -> None:
+            start = time.perf_counter()
+            try:
+                for item in records:
+                    journal.append(item)
+            except Exception as e:
+                print(f"Error appending to tree journal: {e}")
+            SAVE_DURATION.observe(time.perf_counter() - start, mode="journal")
+        return job
+
+    def _save_snapshot(self, root: "TreeNode", role: str, query: str) -> None:
+        self.save_tree_to_json(root, role, query)
+
+    def compact(self, root: "TreeNode", role: str, query: str) -> None:
+        """Write the full JSON snapshot and discard the journal it supersedes."""
+        with self._lock:
+            if self.save_tree_to_json(root, role, query):
+                TreeJournal(self._tree_filename(root, role, query, ".journal.jsonl")).remove()
+
+    def save_tree_to_json(self, root: "TreeNode", role: str, query: str) -> bool:
+        """Saves the tree and logs to a JSON file. Returns True on success."""
+        return self._snapshot_job(root, role, query)()
+
+    def _snapshot_job(self, root: "TreeNode", role: str, query: str) -> Callable[[], bool]:
+        """Capture the tree now; the returned job writes the snapshot and catalogs it, on any thread."""
+        filename = self._tree_filename(root, role, query)
+        data = snapshot_data(root, role, query, self.llm_model)
+        catalog = self.catalog
+        if catalog is not None:
+            nodes, complete = len(root.node_index), is_complete(root)
+
+        def job() -> bool:
+            if not write_snapshot_data(filename, data):
+                return False
+            if catalog is not None:
+                catalog.add(filename, root, role, query, self.llm_model, nodes=nodes, complete=complete)
+            return True
+        return job
+
+
+def tree_filename(root: "TreeNode", role: str, query: str, extension: str = SNAPSHOT_EXTENSION) -> str:
+    """
+    Build the logs/ path for a tree, creating the directory if needed.
+    The root id keeps trees with the same role and query, created in the same second, apart.
+    """
+    logs_dir = "logs"
+    if not os.path.exists(logs_dir):
+        os.makedirs(logs_dir)
+
+    # Sanitize filename
+    safe_role = re.sub(r'[^a-zA-Z0-9]', '_', role[:20])
+    safe_query = re.sub(r'[^a-zA-Z0-9]', '_', query[:30])
+    timestamp = datetime.fromtimestamp(root.created_at).strftime('%Y%m%d_%H%M%S')
+    return f"{logs_dir}/{timestamp}_{safe_role}_{safe_query}_{root.id}{extension}"
+
+
+def write_tree_snapshot(filename: str, root: "TreeNode", role: str, query: str, model: str) -> bool:
+    """Write the full tree and logs as a snapshot (format chosen by the extension). Returns True on success."""
+    return write_snapshot_data(filename, snapshot_data(root, role, query, model))
+
+
+def snapshot_data(root: "TreeNode", role: str, query: str, model: str) -> Dict[str, Any]:
+    """Capture the tree and logs as snapshot data; later changes to the tree do not affect it."""
+    return {
+        "meta": {
+            "role": role,
+            "query": query,
+            "model": model,
+            "created_at": datetime.fromtimestamp(root.created_at).isoformat(),
+            "last_updated": datetime.now().isoformat()
+        },
+        "tree": root.to_dict(),
+        # Log entries are not modified once appended, so a shallow copy is enough
+        "logs": list(root.logs)
+    }
+
+
+def write_snapshot_data(filename: str, data: Dict[str, Any]) -> bool:
+    """Write snapshot_data() output to filename. Returns True on success."""
+    start = time.perf_counter()
+    try:
+        dump_snapshot(filename, data)
+        # print(f"Tree saved to {filename}") # Optional: reduce noise
+        return True
+    except Exception as e:
+        print(f"Error saving tree to JSON: {e}")
+        return False
+    finally:
+        SAVE_DURATION.observe(time.perf_counter() - start, mode="snapshot")
+
+
+def load_tree_from_json(path: str) -> tuple["QuestionNode", Dict[str, Any]]:
+    """
+    Load a tree saved as a logs/*.json or logs/*.json.gz snapshot.
+    Returns the root QuestionNode (with its logs and prompts restored) and the snapshot meta.
+    """
+    data = load_snapshot(path)
+    root = QuestionNode.from_dict(data["tree"])
+    root.logs = list(data.get("logs", []))
+    return root, data.get("meta", {})
+
+
+def load_tree_from_journal(path: str) -> tuple["QuestionNode", Dict[str, Any]]:
+    """
+    Rebuild a tree from a journal written in "journal" persistence mode.
+    Returns the root QuestionNode (with its logs restored) and the journal meta.
+    """
+    root: Optional[QuestionNode] = None
+    meta: Dict[str, Any] = {}
+
+    for record in TreeJournal(path).records():
+        record_type = record.get("type")
+        if record_type == "meta":
+            meta = record
+        elif record_type == "root":
+            root = QuestionNode.from_dict(record["node"])
+            root.logs.append(record["log"])
+        elif record_type == "tree":
+            root = QuestionNode.from_dict(record["tree"])
+            root.logs = list(record.get("logs", []))
+        elif record_type == "expand" and root is not None:
+            parent = root.find_node_by_id(record["parent_id"])
+            if not isinstance(parent, AnswerNode):
+                print(f"Journal references unknown answer {record['parent_id']}")
+                continue
+            question_node = QuestionNode.from_dict(record["node"])
+            parent.set_child(question_node)
+            if record.get("log") is not None:
+                root.logs.append(record["log"])
+
+    if root is None:
+        raise ValueError(f"No root record found in journal: {path}")
+    if "created_at" in meta:
+        root.created_at = meta["created_at"]
+    return root, meta
+
+
+def is_complete(root: "QuestionNode") -> bool:
+    """True if every answer was expanded or cannot be (leaf or max depth)."""
+    return all(
+        node.child is not None or node.is_leaf or node.depth >= MAX_DEPTH
+        for node in root.iter_subtree()
+        if isinstance(node, AnswerNode)
+    )
+
+
+def _narrows(outcomes: List[str], question_data: SubtreeQuestionSchema) -> bool:
+    """True if every answer of question_data keeps a non-empty subset of outcomes."""
+    allowed = set(outcomes)
+    return all(
+        answer.potential_outcomes and allowed.issuperset(answer.potential_outcomes)
+        for answer in question_data.answers
+    )
 
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            # print(f"Tree saved to {filename}") # Optional: reduce noise
-        except Exception as e:
-            print(f"Error saving tree to JSON: {e}")
+
+def _outcome_key(outcomes: List[str]) -> tuple:
+    """Canonical form of an outcome set: order, case and surrounding whitespace are ignored."""
+    return tuple(sorted({outcome.strip().casefold() for outcome in outcomes}))
+
+
+def _subtree_memo(root: "TreeNode") -> Dict[tuple, "QuestionNode"]:
+    """
+    Outcome key -> first question generated for an answer with that outcome set.
+    Built from the existing nodes on first use, so reloaded trees can reuse branches too.
+    """
+    tree = root._tree
+    if tree.subtrees is None:
+        tree.subtrees = {}
+        for node in root.iter_subtree():
+            if isinstance(node, QuestionNode) and node.parent is not None:
+                tree.subtrees.setdefault(_outcome_key(node.parent.potential_outcomes), node)
+    return tree.subtrees
+
+
+class TreeData:
+    """
+    Tree-level state held once by the root node: generation logs, the
+    id -> node index for the whole tree and, when subtree reuse is on,
+    the outcome-set memo.
+    """
+
+    __slots__ = ("logs", "node_index", "subtrees")
+
+    def __init__(self, root: "TreeNode"):
+        self.logs: List[Dict[str, Any]] = []
+        self.node_index: Dict[str, "TreeNode"] = {root.id: root}
+        self.subtrees: Optional[Dict[tuple, "QuestionNode"]] = None
 
 
 class TreeNode:
     """
     Base class for all nodes in the decision tree.
     Tracks parent, depth, and provides utility for path traversal.
+    Nodes use __slots__ to keep large in-memory trees compact.
     """
 
-    def __init__(self, parent: Optional["TreeNode"] = None):
+    __slots__ = ("parent", "id", "created_at", "_depth", "_history", "_tree")
+
+    def __init__(
+        self,
+        parent: Optional["TreeNode"] = None,
+        node_id: Optional[str] = None,
+        created_at: Optional[float] = None,
+    ):
         self.parent = parent
-        self.id = str(uuid.uuid4())
-        self.created_at = time.time()
-        self.logs: List[Dict[str, Any]] = [] # Only used by root, but kept here for simplicity
+        # Depth is stored on attach rather than recomputed by walking to the root
+        self._depth = parent.depth + 1 if parent is not None else 0
+        # Lazily cached get_history_str() output for the default indent
+        self._history: Optional[str] = None
+        self.id = node_id or str(uuid.uuid4())
+        self.created_at = created_at if created_at is not None else time.time()
+        # Logs and the node index live in a single container on the root
+        self._tree: Optional[TreeData] = TreeData(self) if parent is None else None
+
+    @property
+    def logs(self) -> List[Dict[str, Any]]:
+        """Generation logs of the tree this node belongs to."""
+        tree = self.root._tree
+        return tree.logs if tree is not None else []
+
+    @logs.setter
+    def logs(self, value: List[Dict[str, Any]]) -> None:
+        tree = self.root._tree
+        if tree is not None:
+            tree.logs = value
+
+    @property
+    def node_index(self) -> Optional[Dict[str, "TreeNode"]]:
+        """id -> node index of the whole tree; only available on the root."""
+        return self._tree.node_index if self._tree is not None else None
 
     @property
     def depth(self) -> int:
         """Return the depth of the node in the tree (Root is 0)."""
-        if self.parent is None:
-            return 0
-        return self.parent.depth + 1
+        return self._depth
 
     @property
     def is_root(self) -> bool:
@@ -262,22 +1011,66 @@ class TreeNode:
             node = node.parent
         return list(reversed(path))
 
+    def iter_subtree(self) -> Iterator["TreeNode"]:
+        """Iterate over this node and all its descendants (pre-order, no recursion)."""
+        stack: List[TreeNode] = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            if isinstance(node, QuestionNode):
+                stack.extend(reversed(node.answers))
+            elif isinstance(node, AnswerNode) and node.child:
+                stack.append(node.child)
+
+    def _register(self, subtree: "TreeNode") -> None:
+        """Add a newly attached subtree to the root's node index."""
+        index = self.root.node_index
+        if index is None:
+            return
+        if subtree._tree is not None:
+            # Attaching a former root: merge its index instead of walking it
+            index.update(subtree._tree.node_index)
+            subtree._tree = None
+        else:
+            for node in subtree.iter_subtree():
+                index[node.id] = node
+
+    def _reattach(self, subtree: "TreeNode") -> None:
+        """Refresh cached depth and history of a subtree moved under this node."""
+        offset = self._depth + 1 - subtree._depth
+        for node in subtree.iter_subtree():
+            node._depth += offset
+            node._history = None
+
+    def _unregister(self, subtree: "TreeNode") -> None:
+        """Remove a detached subtree from the root's node index."""
+        index = self.root.node_index
+        if index is None:
+            return
+        for node in subtree.iter_subtree():
+            index.pop(node.id, None)
+
+    def rebuild_index(self) -> None:
+        """Rebuild the id -> node index of the tree rooted at this node."""
+        if self._tree is None:
+            self._tree = TreeData(self)
+        self._tree.node_index = {node.id: node for node in self.iter_subtree()}
+
     def find_node_by_id(self, target_id: str) -> Optional["TreeNode"]:
-        """Recursively find a node by ID in this subtree."""
-        if hasattr(self, 'id') and self.id == target_id:
-            return self
-        
-        # Check children
-        if isinstance(self, QuestionNode):
-            for answer in self.answers:
-                found = answer.find_node_by_id(target_id)
-                if found:
-                    return found
-        elif isinstance(self, AnswerNode):
-            if self.child:
-                found = self.child.find_node_by_id(target_id)
-                if found:
-                    return found
+        """Find a node by ID in this subtree using the root's index."""
+        index = self.root.node_index
+        if index is None:
+            return None
+        found = index.get(target_id)
+        if found is None or self.is_root:
+            return found
+
+        # The index covers the whole tree; make sure the match lies under this node
+        node = found
+        while node is not None:
+            if node is self:
+                return found
+            node = node.parent
         return None
 
     def to_dict(self) -> Dict[str, Any]:
@@ -291,30 +1084,45 @@ class TreeNode:
     def __str__(self) -> str:
         """
         Return a string representation of the tree starting from this node.
-        Uses recursion to format the entire subtree.
+        Formats the entire subtree.
         """
         return self._get_tree_string()
 
     def _get_tree_string(self, level: int = 0) -> str:
-        """Helper to recursively build the tree string."""
-        raise NotImplementedError("Subclasses must implement _get_tree_string")
+        """Build the tree string in a single pass over the subtree."""
+        offset = level - self._depth
+        return "".join(node._tree_line(node._depth + offset) for node in self.iter_subtree())
+
+    def _tree_line(self, level: int) -> str:
+        """Format this node's own line of the tree string."""
+        raise NotImplementedError("Subclasses must implement _tree_line")
+
+    def _history_line(self, indent: str) -> str:
+        """Format this node's own line of the history string."""
+        raise NotImplementedError("Subclasses must implement _history_line")
 
     def get_history_str(self, indent: str = "\t") -> str:
         """
         Get formatted history string for LLM context.
         Reconstructs the conversation path from root to this node.
+        With the default indent, each node's history is cached and built from
+        its parent's, so expanding a node costs one line rather than a full path.
         """
-        path = self.get_path()
-        lines = []
-        current_indent = 0
-        
-        for node in path:
-            if isinstance(node, QuestionNode):
-                lines.append(f"{indent * current_indent}Question: {node.question}")
-            elif isinstance(node, AnswerNode):
-                lines.append(f"{indent * current_indent}Answer: {node.answer_text}")
-                current_indent += 1
-        return "\n".join(lines)
+        if indent != "\t":
+            return "\n".join(node._history_line(indent) for node in self.get_path())
+
+        # Walk up to the nearest ancestor with a cached history, then fill in downwards
+        pending = []
+        node = self
+        while node is not None and node._history is None:
+            pending.append(node)
+            node = node.parent
+        history = node._history if node is not None else None
+        for node in reversed(pending):
+            line = node._history_line(indent)
+            history = line if history is None else f"{history}\n{line}"
+            node._history = history
+        return self._history
 
 
 class QuestionNode(TreeNode):
@@ -323,15 +1131,75 @@ class QuestionNode(TreeNode):
     Contains a question and a list of possible answers (branches).
     """
 
-    def __init__(self, question: str, parent: Optional[TreeNode] = None):
-        super().__init__(parent)
+    __slots__ = ("question", "answers")
+
+    def __init__(
+        self,
+        question: str,
+        parent: Optional[TreeNode] = None,
+        node_id: Optional[str] = None,
+        created_at: Optional[float] = None,
+    ):
+        super().__init__(parent, node_id=node_id, created_at=created_at)
         self.question = question
         self.answers: List["AnswerNode"] = []
 
-    def add_answer(self, answer_text: str, potential_outcomes: List[str]) -> "AnswerNode":
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuestionNode":
+        """
+        Rebuild a question subtree from its to_dict() form, keeping node ids.
+        Built top-down without recursion, so the node index stays current.
+        """
+        root = cls(data["question"], node_id=data["id"], created_at=data.get("created_at"))
+        stack = [(root, data)]
+        while stack:
+            node, node_data = stack.pop()
+            for answer_data in node_data.get("answers", []):
+                answer = node.add_answer(
+                    answer_data["answer_text"],
+                    answer_data["potential_outcomes"],
+                    node_id=answer_data["id"],
+                    created_at=answer_data.get("created_at"),
+                )
+                answer.frontier = answer_data.get("frontier", False)
+                child_data = answer_data.get("child")
+                if child_data:
+                    child = cls(child_data["question"], node_id=child_data["id"], created_at=child_data.get("created_at"))
+                    answer.set_child(child)
+                    stack.append((child, child_data))
+        return root
+
+    def copy(self, root_id: Optional[str] = None) -> "QuestionNode":
+        """
+        Independent copy of this question's subtree with new node ids (root_id for
+        the top question, if given) and creation times. Logs are copied for roots.
+        """
+        root = QuestionNode(self.question, node_id=root_id)
+        stack = [(root, self)]
+        while stack:
+            node, original = stack.pop()
+            for answer in original.answers:
+                new_answer = node.add_answer(answer.answer_text, answer.potential_outcomes)
+                new_answer.frontier = answer.frontier
+                if answer.child is not None:
+                    child = QuestionNode(answer.child.question)
+                    new_answer.set_child(child)
+                    stack.append((child, answer.child))
+        if self.parent is None:
+            root.logs = list(self.logs)
+        return root
+
+    def add_answer(
+        self,
+        answer_text: str,
+        potential_outcomes: List[str],
+        node_id: Optional[str] = None,
+        created_at: Optional[float] = None,
+    ) -> "AnswerNode":
         """Add an answer branch to this question."""
-        answer_node = AnswerNode(answer_text, potential_outcomes, parent=self)
+        answer_node = AnswerNode(answer_text, potential_outcomes, parent=self, node_id=node_id, created_at=created_at)
         self.answers.append(answer_node)
+        self._register(answer_node)
         return answer_node
 
     def to_dict(self) -> Dict[str, Any]:
@@ -343,12 +1211,12 @@ class QuestionNode(TreeNode):
         })
         return data
 
-    def _get_tree_string(self, level: int = 0) -> str:
+    def _tree_line(self, level: int) -> str:
         indent = "\t" * level
-        result = f"{indent}Question: {self.question}\n"
-        for answer in self.answers:
-            result += answer._get_tree_string(level + 1)
-        return result
+        return f"{indent}Question: {self.question}\n"
+
+    def _history_line(self, indent: str) -> str:
+        return f"{indent * (self._depth // 2)}Question: {self.question}"
 
     def __repr__(self) -> str:
         return f"<QuestionNode depth={self.depth} question='{self.question}' branches={len(self.answers)}>"
@@ -360,22 +1228,38 @@ class AnswerNode(TreeNode):
     Contains the answer text, potential outcomes, and a child node (next question or None).
     """
 
-    def __init__(self, answer_text: str, potential_outcomes: List[str], parent: Optional[TreeNode] = None):
-        super().__init__(parent)
+    __slots__ = ("answer_text", "potential_outcomes", "child", "frontier")
+
+    def __init__(
+        self,
+        answer_text: str,
+        potential_outcomes: List[str],
+        parent: Optional[TreeNode] = None,
+        node_id: Optional[str] = None,
+        created_at: Optional[float] = None,
+    ):
+        super().__init__(parent, node_id=node_id, created_at=created_at)
         self.answer_text = answer_text
-        self.potential_outcomes = potential_outcomes
+        # Outcome strings repeat across most answers of a tree, so share one copy of each
+        self.potential_outcomes = [sys.intern(o) for o in potential_outcomes] if INTERN_OUTCOMES else potential_outcomes
         self.child: Optional[QuestionNode] = None
+        # Left unexpanded when a budgeted run stopped; resume() picks these up
+        self.frontier = False
 
     @property
     def is_leaf(self) -> bool:
         """Check if this is a leaf node (single outcome or max depth reached)."""
-        # We can also consider it a leaf if we hit MAX_DEPTH, though logic might vary.
+        # MAX_DEPTH is enforced by ExpansionScheduler during recursive generation.
         return len(self.potential_outcomes) <= 1
 
     def set_child(self, question_node: "QuestionNode") -> None:
         """Set the child question node."""
+        if self.child is not None and self.child is not question_node:
+            self._unregister(self.child)
         self.child = question_node
         question_node.parent = self
+        self._reattach(question_node)
+        self._register(question_node)
 
     def to_dict(self) -> Dict[str, Any]:
         data = super().to_dict()
@@ -383,23 +1267,23 @@ class AnswerNode(TreeNode):
             "type": "answer",
             "answer_text": self.answer_text,
             "potential_outcomes": self.potential_outcomes,
+            "frontier": self.frontier,
             "child": self.child.to_dict() if self.child else None
         })
         return data
 
-    def _get_tree_string(self, level: int = 0) -> str:
+    def _tree_line(self, level: int) -> str:
         indent = "\t" * level
         outcomes_str = ", ".join(self.potential_outcomes)
         result = f"{indent}Answer: \"{self.answer_text}\" -> [{outcomes_str}]"
-        
-        if self.depth >= MAX_DEPTH:
+
+        if self._depth >= MAX_DEPTH:
              result += " [MAX DEPTH REACHED]"
-        
-        result += "\n"
-        
-        if self.child:
-            result += self.child._get_tree_string(level + 1)
-        return result
+
+        return result + "\n"
+
+    def _history_line(self, indent: str) -> str:
+        return f"{indent * (self._depth // 2)}Answer: {self.answer_text}"
 
     def __repr__(self) -> str:
         return f"<AnswerNode depth={self.depth} answer='{self.answer_text}' outcomes={len(self.potential_outcomes)}>"
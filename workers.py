@@ -0,0 +1,68 @@
+"""Bounded asyncio task runner for generation work."""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from metrics import QUEUE_WAIT
+
+
+class ExecutorBusyError(RuntimeError):
+    """Raised when the runner's queue is full and no more work is accepted."""
+
+
+class BoundedTaskRunner:
+    """
+    Runs coroutines as tasks on the event loop, at most max_concurrency at a
+    time with up to max_queue waiting. submit() raises ExecutorBusyError instead
+    of queueing without limit, so the caller can shed load (e.g. answer 503).
+    Must be used from the loop thread.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._pending = 0
+        self._running = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> asyncio.Task:
+        if self._pending >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusyError("Server is busy, try again later")
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._pending += 1
+        task = asyncio.get_running_loop().create_task(self._run(time.perf_counter(), fn, *args, **kwargs))
+        # Keep a reference so the task is not garbage collected mid-flight
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, submitted: float, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        try:
+            async with self._semaphore:
+                QUEUE_WAIT.observe(time.perf_counter() - submitted)
+                self._running += 1
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self._running -= 1
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Report in-flight and queued task counts."""
+        return {
+            "in_flight": self._running,
+            "queued": self._pending - self._running,
+            "max_workers": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()